@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "back.settings")
+# Files are streamed by async views, so slow clients don't hold worker threads
+os.environ.setdefault("ASYNC_VIEWS", "True")
 
 application = get_asgi_application()
@@ -24,6 +24,118 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_ROOT = BASE_DIR / os.getenv("STORAGE_DIR", "data/")
 STORAGE_DIR = MEDIA_ROOT
 
+# File storage backend (Django storage API):
+#   storage.backends.LocalStorage - files in STORAGE_DIR
+#   storage.s3.S3Storage - S3-compatible object storage (needs django-storages[s3] package)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "storage.backends.LocalStorage")
+# S3 bucket, endpoint (e.g. http://localhost:9000 for MinIO) and credentials
+AWS_STORAGE_BUCKET_NAME = os.getenv("S3_BUCKET", "")
+AWS_S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+AWS_S3_REGION_NAME = os.getenv("S3_REGION") or None
+AWS_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY") or None
+AWS_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_KEY") or None
+# Files larger than threshold are uploaded (and copied) by parts of given size (bytes)
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024))
+S3_MULTIPART_CHUNK_SIZE = int(os.getenv("S3_MULTIPART_CHUNK_SIZE", 8 * 1024 * 1024))
+# Lifetime (seconds) of presigned download URLs (redirect download backend)
+S3_URL_EXPIRE = int(os.getenv("S3_URL_EXPIRE", 300))
+
+# Levels of hashed fan-out dirs above user's dir (2 hex chars each), e.g. 2 - ab/cd/<user uuid>/<file>,
+# 0 - flat <user uuid>/<file>. Existing files are moved to current layout by 'relayout_files' command
+STORAGE_FANOUT = int(os.getenv("STORAGE_FANOUT", 0))
+
+# Dir in storage for uploads in progress: part files of resumable uploads, temp files of received uploads
+# and replacing content put aside until it's renamed in place (must be on the same file system as STORAGE_DIR)
+UPLOAD_DIR = ".uploads"
+# Size of chunks (bytes) for reading uploaded data
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 64 * 1024))
+# Resumable uploads: max file size (bytes) and max open sessions per user, part file is preallocated at full size.
+# Session without received chunks for UPLOAD_SESSION_TTL seconds expires and is deleted with its part file
+UPLOAD_SESSION_MAX_SIZE = int(os.getenv("UPLOAD_SESSION_MAX_SIZE", 10 * 1024 ** 3))
+UPLOAD_SESSION_MAX_COUNT = int(os.getenv("UPLOAD_SESSION_MAX_COUNT", 5))
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600))
+
+# Content-addressed storage: files with equal content are stored once (as shared blobs)
+STORAGE_DEDUP = os.getenv("STORAGE_DEDUP", "False") == "True"
+
+# Store content compressed at rest (zstd seekable format, needs zstandard package), incompressible files are stored as is
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "False") == "True"
+STORAGE_COMPRESSION_LEVEL = int(os.getenv("STORAGE_COMPRESSION_LEVEL", 3))
+# Size of independently compressed frames (bytes): granularity of random access for Range requests
+STORAGE_FRAME_SIZE = int(os.getenv("STORAGE_FRAME_SIZE", 1024 * 1024))
+
+# Default users' quotas: max count of files and total size of files (bytes), 0 - unlimited
+STORAGE_QUOTA_FILES = int(os.getenv("STORAGE_QUOTA_FILES", 0))
+STORAGE_QUOTA_SIZE = int(os.getenv("STORAGE_QUOTA_SIZE", 0))
+
+# Size of chunks (bytes) for streaming file downloads
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 64 * 1024))
+# Max number of byte ranges in one request (more ranges - whole file is sent)
+DOWNLOAD_MAX_RANGES = int(os.getenv("DOWNLOAD_MAX_RANGES", 16))
+# File delivery backend:
+#   stream - files are streamed by Django worker
+#   x-accel-redirect - files are sent by nginx from internal location DOWNLOAD_INTERNAL_URL
+#   x-sendfile - files are sent by web server (Apache mod_xsendfile, lighttpd) by absolute path
+#   redirect - client is redirected to presigned URL of file in object storage (storage.s3.S3Storage)
+DOWNLOAD_BACKEND = os.getenv("DOWNLOAD_BACKEND", "stream").lower()
+# nginx internal location mapped to STORAGE_DIR (for x-accel-redirect backend)
+DOWNLOAD_INTERNAL_URL = os.getenv("DOWNLOAD_INTERNAL_URL", "/protected/")
+# Compress downloads of text-like files (not smaller than N bytes) on the fly by Accept-Encoding: br, zstd, gzip
+# (br and zstd need brotli and zstandard packages)
+DOWNLOAD_COMPRESSION = os.getenv("DOWNLOAD_COMPRESSION", "True") == "True"
+DOWNLOAD_COMPRESS_MIN_SIZE = int(os.getenv("DOWNLOAD_COMPRESS_MIN_SIZE", 1024))
+# Encodings of precompressed copies built at upload (e.g. "br,gzip"), "" - off
+DOWNLOAD_COMPRESS_SIDECARS = [e for e in os.getenv("DOWNLOAD_COMPRESS_SIDECARS", "").lower().split(",") if e]
+# Dir in storage for precompressed copies (addressed by content hash)
+COMPRESSED_DIR = ".compressed"
+# Serve downloads and uploads by async views (set by back/asgi.py, WSGI server uses sync views)
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "False") == "True"
+# Buffer download counters in memory and flush them to DB by batches (for hot links)
+DOWNLOADS_BUFFERED = os.getenv("DOWNLOADS_BUFFERED", "False") == "True"
+# Flush buffered counters every N seconds or after N downloads
+DOWNLOADS_FLUSH_INTERVAL = float(os.getenv("DOWNLOADS_FLUSH_INTERVAL", 5))
+DOWNLOADS_FLUSH_SIZE = int(os.getenv("DOWNLOADS_FLUSH_SIZE", 100))
+
+# Cache of resolved download links: django - Django's cache (CACHES), "" - off.
+# Cache must be shared by workers (memcached, redis, db), so a changed link is dropped for all of them at once
+LINK_CACHE = os.getenv("LINK_CACHE", "").lower()
+LINK_CACHE_ALIAS = os.getenv("LINK_CACHE_ALIAS", "default")
+# Max lifetime (seconds) of cached links
+LINK_CACHE_TTL = int(os.getenv("LINK_CACHE_TTL", 60))
+# Negative cache of unknown links (backends as of LINK_CACHE), its lifetime (seconds) and max count (local backend)
+LINK_MISS_CACHE = os.getenv("LINK_MISS_CACHE", "local").lower()
+LINK_MISS_TTL = int(os.getenv("LINK_MISS_TTL", 600))
+LINK_MISS_SIZE = int(os.getenv("LINK_MISS_SIZE", 100000))
+
+# Rate limit of invalid link lookups per client IP (token bucket): refill rate (tokens per second, 0 - off)
+# and bucket size. State store: local - in-process memory, django - Django's cache (CACHES)
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", 0.2))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 20))
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "local").lower()
+# META key of client IP: header set by proxy (e.g. HTTP_X_REAL_IP) or REMOTE_ADDR if clients connect directly.
+# Limit is off if it isn't set (behind proxy REMOTE_ADDR is proxy's address shared by all clients)
+RATE_LIMIT_IP_HEADER = os.getenv("RATE_LIMIT_IP_HEADER", "")
+
+# Max size of JSON request body, larger body isn't read
+JSON_BODY_MAX_SIZE = int(os.getenv("JSON_BODY_MAX_SIZE", 1024 * 1024))
+
+# Files per page in file list (default and max value of 'limit' param)
+FILE_LIST_LIMIT = int(os.getenv("FILE_LIST_LIMIT", 100))
+FILE_LIST_MAX_LIMIT = int(os.getenv("FILE_LIST_MAX_LIMIT", 1000))
+# Rows fetched from DB and encoded at once in streamed file list (all=1&stream=1)
+FILE_LIST_STREAM_BATCH = int(os.getenv("FILE_LIST_STREAM_BATCH", 2000))
+
+# Max number of files in one bulk request (delete, change, link) and threads deleting files from storage
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", 1000))
+BULK_DELETE_WORKERS = int(os.getenv("BULK_DELETE_WORKERS", 8))
+
+# Extraction of uploaded archives (zip/tar): max number of files, max total size of extracted files,
+# max ratio of extracted size to archive size (zip bomb guard) and threads storing extracted files
+EXTRACT_MAX_MEMBERS = int(os.getenv("EXTRACT_MAX_MEMBERS", 1000))
+EXTRACT_MAX_SIZE = int(os.getenv("EXTRACT_MAX_SIZE", 1024 ** 3))
+EXTRACT_MAX_RATIO = int(os.getenv("EXTRACT_MAX_RATIO", 100))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", 4))
+
 # Backend URL
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000/")
 # Frontend URL
@@ -108,6 +220,28 @@ DATABASES = {
 
 AUTH_USER_MODEL = "users.User"
 
+# Storages
+# https://docs.djangoproject.com/en/4.2/ref/settings/#storages
+
+STORAGES = {
+    "default": {
+        "BACKEND": STORAGE_BACKEND,
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -173,4 +307,10 @@ ERROR_NEED_LOGIN = {"error": 401, "error_msg": "Login needed"}
 ERROR_EXIST_LOGIN = {"error": 400, "error_msg": "Login already exists"}
 ERROR_METHOD = {"error": 405, "error_msg": "Method not allowed"}
 FILE_404 = {"error": 404, "error_msg": "File not found"}
+ERROR_BAD_CURSOR = {"error": 400, "error_msg": "Invalid cursor or limit"}
+ERROR_BAD_FIELDS = {"error": 400, "error_msg": "Unknown fields requested"}
+ERROR_BAD_BULK = {"error": 400, "error_msg": "Invalid list of files"}
+ERROR_BAD_UPLOAD = {"error": 400, "error_msg": "Invalid file size or checksum"}
+ERROR_BAD_CHUNK = {"error": 400, "error_msg": "Invalid chunk offset or length"}
+ERROR_SESSION_404 = {"error": 404, "error_msg": "Upload session not found"}
 ERROR_SOME = {"error": 405, "error_msg": "Some error occurred"}
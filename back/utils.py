@@ -1,13 +1,72 @@
+import base64
+import binascii
+import itertools
 import json
 import re
 
-from django.http import JsonResponse, HttpRequest, QueryDict
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpRequest, HttpResponse, QueryDict
 from django.http.multipartparser import MultiPartParser
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from back.settings import ERROR_NO_AUTH, ERROR_METHOD, ERROR_NO_PERMIT, JSON_BODY_MAX_SIZE
+
+
+def json_loads(data: bytes):
+    """ Decode JSON by orjson (if installed) or stdlib decoder, raises ValueError """
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def json_dumps(data) -> bytes:
+    """ Encode data to JSON by orjson (if installed) or stdlib encoder, other types are encoded as by Django """
+    if orjson:
+        return orjson.dumps(data, default=DjangoJSONEncoder().default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+def json_stream(data: dict, key: str, items, batch_size=1000):
+    """
+        Encode data with list of items under key (the last key of object) as JSON by parts:
+        items are encoded by batches while they're fetched, the whole list isn't held in memory
+    """
 
-from back.settings import ERROR_NO_AUTH, ERROR_METHOD, ERROR_NO_PERMIT
+    head = json_dumps(data)[:-1]
+    yield head + (b", " if len(head) > 1 else b"") + json_dumps(key) + b": ["
+    items = iter(items)
+    separator = b""
+    while batch := list(itertools.islice(items, batch_size)):
+        yield separator + json_dumps(batch)[1:-1]
+        separator = b", "
+    yield b"]}"
+
+
+class JsonResponse(HttpResponse):
+    """ django.http.JsonResponse encoded by json_dumps (orjson if installed) """
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError("In order to allow non-dict objects to be serialized set the safe parameter to False.")
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=json_dumps(data), **kwargs)
 
 
 def auth_required(func):
+    if iscoroutinefunction(func):
+        async def async_wrap(request, *args, **kwargs):
+            # request.user is loaded lazily from DB, it can't be done in event loop
+            if await sync_to_async(lambda: request.user.is_authenticated)():
+                return await func(request, *args, **kwargs)
+            else:
+                return JsonResponse(ERROR_NO_AUTH)
+        return async_wrap
+
     def wrap(request, *args, **kwargs):
         if request.user.is_authenticated:
             return func(request, *args, **kwargs)
@@ -27,6 +86,14 @@ def admin_only(func):
 
 def allowed_methods(*methods):
     def decor(func):
+        if iscoroutinefunction(func):
+            async def async_wrap(request, *args, **kwargs):
+                if request.method in methods:
+                    return await func(request, *args, **kwargs)
+                else:
+                    return JsonResponse(ERROR_METHOD)
+            return async_wrap
+
         def wrap(request, *args, **kwargs):
             if request.method in methods:
                 return func(request, *args, **kwargs)
@@ -37,14 +104,36 @@ def allowed_methods(*methods):
 
 
 def parse_body(request: HttpRequest) -> dict:
+    """
+        Data of request body (JSON, multipart or urlencoded form), it's parsed once per request
+        JSON body over JSON_BODY_MAX_SIZE, invalid JSON or JSON other than object gives empty dict
+    """
+
+    if not hasattr(request, "_parsed_body"):
+        request._parsed_body = read_body(request)
+    return request._parsed_body
+
+
+def read_body(request: HttpRequest) -> dict:
+
+    if request.content_type.startswith("application/json"):
+        length = request.META.get("CONTENT_LENGTH")
+        if length and (not length.isdigit() or int(length) > JSON_BODY_MAX_SIZE):
+            return {}
+        try:
+            data = json_loads(request.body)
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    if request.method == "POST":
+        # Form is parsed (and files are received by upload handlers) once by Django itself
+        return request.POST
 
     if request.content_type.startswith("multipart"):
         data, m_dict = MultiPartParser(request.META, request, request.upload_handlers).parse()
         return data
 
-    if request.content_type.startswith("application/json"):
-        return json.loads(request.body.decode('utf-8'))
-
     return QueryDict(request.body)
 
 
@@ -62,3 +151,38 @@ def valid_password(psw: str) -> bool:
 
 def valid_filename(name: str) -> bool:
     return bool(re.match(r"^[^\n\\/:*?\"<>|]+(?<!\.)$", name))
+
+
+def valid_int(value) -> bool:
+    """ JSON integer (bool is int subclass in Python, but true/false aren't valid ids or sizes) """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def encode_cursor(*values) -> str:
+    """ Opaque cursor for keyset pagination """
+    return base64.urlsafe_b64encode(json_dumps(values)).decode()
+
+
+def decode_cursor(cursor: str):
+    """ returns: list of values, None if cursor is invalid """
+    try:
+        values = json_loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def set_validators(response, etag: str, last_modified=None):
+    """ Set ETag/Last-Modified (timestamp) of response, client has to revalidate it on every use """
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, etag: str, last_modified=None):
+    """ returns: 304 (or 412) response to conditional request, None if full response is needed """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified, response=set_validators(HttpResponse(), etag, last_modified))
+    return response if response.status_code in (304, 412) else None
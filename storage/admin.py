@@ -1,15 +1,73 @@
+import hashlib
+
 from django.contrib import admin
 
-from storage.models import StoredFile, Link
+from storage.cache import forget_links
+from storage.models import StoredFile, Link, Blob, CONTENT_FIELDS
+from users.models import User
+
+
+def set_uploaded_content(file, content):
+    """ Attach content uploaded in admin to stored file as API upload does (size, hash, blob, compression) """
+
+    hash = hashlib.sha256()
+    for chunk in content.chunks():
+        hash.update(chunk)
+    content.seek(0)
+
+    old = StoredFile.objects.filter(pk=file.pk).select_related("blob", "owner").first() if file.pk else None
+    if not old:
+        file.set_content(content, hash.hexdigest())
+        return
+    new = StoredFile(name=old.name, owner=old.owner)
+    new.set_content(content, hash.hexdigest(), pending=True)
+    old.forget_links()
+    old.replace_content(new)
+    file.file = old.file.name
+    for field in CONTENT_FIELDS:
+        setattr(file, field, getattr(old, field))
 
 
 @admin.register(StoredFile)
 class FileAdmin(admin.ModelAdmin):
-    list_display = ["pk", "name", "owner", "size", "downloads", "created_at"]
+    list_display = ["pk", "name", "owner", "size_bytes", "disk_bytes", "downloads", "created_at"]
     list_display_links = ("name",)
+    readonly_fields = CONTENT_FIELDS
+
+    def save_model(self, request, obj, form, change):
+        if "file" in form.changed_data:
+            set_uploaded_content(obj, form.cleaned_data["file"])
+        super().save_model(request, obj, form, change)
+        if "file" in form.changed_data:
+            obj.compress_content()
+        owners = {obj.owner_id}
+        if change and "owner" in form.changed_data:
+            owners.add(form.initial["owner"])
+        [u.recount_usage() for u in User.objects.filter(pk__in=owners)]
+
+    def delete_model(self, request, obj):
+        obj.remove()
+
+    def delete_queryset(self, request, queryset):
+        StoredFile.delete_all(list(queryset))
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ["pk", "sha256", "size_bytes", "disk_bytes", "refs", "created_at"]
+    list_display_links = ("sha256",)
+    readonly_fields = ["sha256", "file", "size_bytes", "disk_bytes", "compressed", "refs"]
 
 
 @admin.register(Link)
 class LinkAdmin(admin.ModelAdmin):
-    list_display = ["pk", "to_file", "href", "created_at", "expire_at"]
+    list_display = ["pk", "to_file", "archive", "href", "created_at", "expire_at"]
     list_display_links = ("href",)
+
+    def delete_model(self, request, obj):
+        forget_links([obj.href])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        forget_links(queryset.values_list("href", flat=True))
+        super().delete_queryset(request, queryset)
@@ -0,0 +1,146 @@
+"""
+    Archive (zip or tar) of several stored files built on the fly while it's sent:
+    content is read and written by chunks, only the current chunk is held in memory
+"""
+import io
+import tarfile
+import zipfile
+from datetime import datetime, timezone
+
+from django.http import StreamingHttpResponse
+
+from back.settings import logger, DOWNLOAD_CHUNK_SIZE
+from storage.compression import compressible
+from storage.download import AsyncChunks, open_chunks
+
+ARCHIVE_TYPES = {
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+}
+BLOCK = tarfile.BLOCKSIZE
+RECORD = tarfile.RECORDSIZE
+EPOCH = datetime(1980, 1, 1, tzinfo=timezone.utc)
+# Columns of stored files needed to put them into archive
+ARCHIVE_COLUMNS = ("file", "name", "size_bytes", "compressed", "created_at", "updated_at")
+
+
+class Sink(io.RawIOBase):
+    """ Unseekable output of zipfile: written bytes are taken away by archive iterator """
+
+    def __init__(self):
+        super().__init__()
+        self.data = []
+        self.pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data.append(bytes(b))
+        self.pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.pos
+
+    def take(self) -> bytes:
+        data, self.data = b"".join(self.data), []
+        return data
+
+
+class ArchiveChunks:
+    """
+        Iterate over archive of stored files by chunks
+        Zip entries of text-like files are deflated, others (mostly compressed already) are stored as is,
+        sizes and offsets over 4 GiB are written in zip64 format
+    """
+
+    def __init__(self, files, archive_format="zip"):
+        self.files = files
+        self.format = archive_format
+        self.chunks = None
+
+    def __iter__(self):
+        chunks = self.zip() if self.format == "zip" else self.tar()
+        return (chunk for chunk in chunks if chunk)
+
+    def entries(self):
+        """ Opened stored files with unique names in archive, missing files are skipped """
+        names = set()
+        for file in self.files:
+            name, n = file.name, 1
+            while name in names:
+                stem, dot, ext = file.name.rpartition(".")
+                name = f"{stem} ({n}).{ext}" if dot else f"{file.name} ({n})"
+                n += 1
+            try:
+                self.chunks = open_chunks(file, 0, file.size_bytes)
+            except FileNotFoundError:
+                logger.error(f"Action: archive file {file.pk}: {file.file.name} | File not found!")
+                continue
+            names.add(name)
+            try:
+                yield name, file
+            finally:
+                self.chunks.close()
+                self.chunks = None
+
+    def zip(self):
+        sink = Sink()
+        with zipfile.ZipFile(sink, "w") as archive:
+            for name, file in self.entries():
+                info = zipfile.ZipInfo(name, modified(file).timetuple()[:6])
+                info.file_size = file.size_bytes
+                info.external_attr = 0o644 << 16
+                info.compress_type = zipfile.ZIP_DEFLATED if compressible(name) else zipfile.ZIP_STORED
+                with archive.open(info, "w") as dst:
+                    for chunk in self.chunks:
+                        dst.write(chunk)
+                        yield sink.take()
+                yield sink.take()
+        yield sink.take()
+
+    def tar(self):
+        pos = 0
+        for name, file in self.entries():
+            info = tarfile.TarInfo(name)
+            info.size = file.size_bytes
+            info.mtime = int(modified(file).timestamp())
+            info.mode = 0o644
+            header = info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+            yield header
+
+            written = 0
+            for chunk in self.chunks:
+                written += len(chunk)
+                yield chunk
+            if written < info.size:
+                # Size in header is already sent, the rest of entry is filled with zeros
+                logger.error(f"Action: archive file {file.pk}: {file.file.name} | File is shorter than expected!")
+                for offset in range(written, info.size, DOWNLOAD_CHUNK_SIZE):
+                    yield bytes(min(DOWNLOAD_CHUNK_SIZE, info.size - offset))
+            padding = -info.size % BLOCK
+            yield bytes(padding)
+            pos += len(header) + info.size + padding
+
+        # End of archive: two empty blocks, padded to full record
+        pos += 2 * BLOCK
+        yield bytes(2 * BLOCK + -pos % RECORD)
+
+    def close(self):
+        if self.chunks:
+            self.chunks.close()
+
+
+def modified(file) -> datetime:
+    """ Modification time of archive entry (zip dates start from 1980) """
+    return max(file.updated_at or EPOCH, EPOCH)
+
+
+def archive_response(files: list, archive_format="zip", is_async=False) -> StreamingHttpResponse:
+    """ Stream archive of files (fetched with ARCHIVE_COLUMNS), is_async: archive is streamed by async iterator """
+    content = ArchiveChunks(files, archive_format)
+    response = StreamingHttpResponse(
+        AsyncChunks(content) if is_async else content, content_type=ARCHIVE_TYPES[archive_format])
+    response["Content-Disposition"] = f"attachment; filename='files.{archive_format}'"
+    return response
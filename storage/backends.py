@@ -0,0 +1,38 @@
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+
+class LocalStorage(FileSystemStorage):
+    """ Files in local directory (STORAGE_DIR) """
+
+    def copy(self, old_name: str, new_name: str):
+        """ Copy stored file to new name by hard link (no data is copied), existing file is replaced """
+        new_path = self.path(new_name)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        tmp_path = f"{new_path}.{os.getpid()}.tmp"
+        os.link(self.path(old_name), tmp_path)
+        os.replace(tmp_path, new_path)
+
+    def move(self, old_name: str, new_name: str):
+        """ Move stored file to new name (existing file is replaced) """
+        new_path = self.path(new_name)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        os.replace(self.path(old_name), new_path)
+
+    def remove_dir(self, name: str):
+        """ Remove empty directory and its parents that become empty (fan-out dirs) """
+        while name:
+            path = self.path(name)
+            if not os.path.isdir(path) or os.listdir(path):
+                break
+            try:
+                os.rmdir(path)
+            except OSError:
+                # File is put into the dir (or dir is removed) concurrently
+                break
+            name = name.rpartition("/")[0]
+
+    def download_url(self, name: str, filename: str):
+        """ Direct download URL of file (files aren't served by URL from local storage) """
+        return None
@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from back.settings import logger, LINK_CACHE, LINK_CACHE_ALIAS, LINK_MISS_CACHE, LINK_MISS_SIZE
+
+
+class LocalCache:
+    """ In-process LRU cache with per-key TTL (every worker process has its own copy) """
+
+    def __init__(self, max_size=LINK_MISS_SIZE):
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return default
+            if item[1] < time.monotonic():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + timeout)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            [self.data.pop(key, None) for key in keys]
+
+
+class SharedCache:
+    """ Django's cache framework (shared by all workers with memcached/redis/db backend) """
+
+    def __init__(self, prefix, alias=LINK_CACHE_ALIAS):
+        self.prefix = prefix
+        self.alias = alias
+
+    def get(self, key, default=None):
+        return caches[self.alias].get(self.prefix + key, default)
+
+    def set(self, key, value, timeout):
+        caches[self.alias].set(self.prefix + key, value, timeout)
+
+    def delete_many(self, keys):
+        caches[self.alias].delete_many([self.prefix + key for key in keys])
+
+
+def is_shared(backend: str, alias=LINK_CACHE_ALIAS) -> bool:
+    """ Cache is shared by all worker processes, so entry dropped by one process is dropped for all """
+    return backend == "django" and not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def make_cache(backend: str, prefix: str, **kwargs):
+    if backend == "local":
+        return LocalCache(**kwargs)
+    if backend == "django":
+        return SharedCache(prefix)
+    return None
+
+
+# Resolved download links: href -> file data. Cache that isn't shared would keep links dropped in other process
+link_cache = make_cache(LINK_CACHE, "link:") if LINK_CACHE and is_shared(LINK_CACHE) else None
+if LINK_CACHE and not link_cache:
+    logger.warning(f"Link cache is off: LINK_CACHE={LINK_CACHE} isn't shared by workers")
+# Unknown hrefs (negative cache): href -> True
+miss_cache = make_cache(LINK_MISS_CACHE, "link-miss:", max_size=LINK_MISS_SIZE)
+
+
+def forget_links(hrefs):
+    hrefs = list(hrefs)
+    if link_cache:
+        link_cache.delete_many(hrefs)
+    if miss_cache:
+        miss_cache.delete_many(hrefs)
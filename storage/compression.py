@@ -0,0 +1,165 @@
+import mimetypes
+import tempfile
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from back.settings import logger, DOWNLOAD_BACKEND, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_COMPRESSION
+from back.settings import DOWNLOAD_COMPRESS_MIN_SIZE, DOWNLOAD_COMPRESS_SIDECARS, COMPRESSED_DIR
+from storage.frames import read_frames
+
+# Non text/* types worth compressing
+COMPRESSIBLE_TYPES = {
+    "application/json", "application/xml", "application/javascript", "application/x-javascript",
+    "application/ecmascript", "application/sql", "application/x-sh", "application/x-yaml", "application/yaml",
+    "application/x-ndjson", "application/rtf", "application/x-tex", "application/postscript",
+}
+
+
+def gzip_compressor(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def brotli_compressor(level):
+    compressor = brotli.Compressor(quality=level)
+    return compressor.process, compressor.finish
+
+
+def zstd_compressor(level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return compressor.compress, compressor.flush
+
+
+# Available encodings in order of preference: name -> (compressor, level on the fly, level of sidecar, extension)
+ENCODINGS = {
+    name: params for name, params in (
+        ("br", (brotli_compressor, 4, 9, ".br") if brotli else None),
+        ("zstd", (zstd_compressor, 3, 12, ".zst") if zstandard else None),
+        ("gzip", (gzip_compressor, 6, 9, ".gz")),
+    ) if params
+}
+
+
+def content_type(name: str) -> str:
+    """ Content type detected by file name """
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def compressible(name: str) -> bool:
+    ctype = content_type(name)
+    return (ctype.startswith("text/") or ctype in COMPRESSIBLE_TYPES
+            or ctype.endswith("+json") or ctype.endswith("+xml"))
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """ returns: {encoding: q-value} of Accept-Encoding header """
+
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+def negotiate(request, file):
+    """
+        Choose content encoding for download of whole file (ranges are served uncompressed)
+        returns: encoding name or None (identity)
+    """
+
+    if not may_compress(file) or "HTTP_RANGE" in request.META:
+        return None
+
+    accepted = parse_accept_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    best, best_q = None, 0.0
+    for name in ENCODINGS:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def may_compress(file) -> bool:
+    """ Response for file depends on Accept-Encoding of request """
+    return (DOWNLOAD_COMPRESSION and DOWNLOAD_BACKEND == "stream"
+            and file.size_bytes >= DOWNLOAD_COMPRESS_MIN_SIZE and compressible(file.name))
+
+
+class CompressedChunks:
+    """ Compress chunks of file on the fly """
+
+    def __init__(self, chunks, encoding):
+        self.chunks = chunks
+        self.encoding = encoding
+
+    def __iter__(self):
+        factory, level = ENCODINGS[self.encoding][:2]
+        compress, flush = factory(level)
+        for chunk in self.chunks:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield flush()
+
+    def close(self):
+        self.chunks.close()
+
+
+def sidecar_path(sha256: str, encoding: str) -> str:
+    """ Name (in storage) of precompressed copy of content, addressed by hash of content """
+    return f"{COMPRESSED_DIR}/{sha256[:2]}/{sha256}{ENCODINGS[encoding][3]}"
+
+
+def build_sidecars(name: str, filename: str, sha256: str, size: int, compressed=False):
+    """
+        Build precompressed copies of stored content (DOWNLOAD_COMPRESS_SIDECARS)
+        name: name of content in storage, filename: name of file (for content type)
+        compressed: stored content is compressed at rest (see storage.frames)
+    """
+
+    if not sha256 or size < DOWNLOAD_COMPRESS_MIN_SIZE or not compressible(filename):
+        return
+
+    for encoding in DOWNLOAD_COMPRESS_SIDECARS:
+        if encoding not in ENCODINGS:
+            continue
+        target = sidecar_path(sha256, encoding)
+        if default_storage.exists(target):
+            continue
+        factory, _, level = ENCODINGS[encoding][:3]
+        compress, flush = factory(level)
+        try:
+            with default_storage.open(name, "rb") as src, tempfile.TemporaryFile() as tmp:
+                chunks = read_frames(src) if compressed else iter(lambda: src.read(DOWNLOAD_CHUNK_SIZE), b"")
+                for chunk in chunks:
+                    tmp.write(compress(chunk))
+                tmp.write(flush())
+                tmp.seek(0)
+                default_storage.save(target, File(tmp))
+        except OSError as e:
+            logger.error(f"Action: compress {name} ({encoding}) | {e}")
+
+
+def remove_sidecars(sha256: str):
+    for encoding in ENCODINGS:
+        default_storage.delete(sidecar_path(sha256, encoding))
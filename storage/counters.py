@@ -0,0 +1,78 @@
+import atexit
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from back.settings import logger, DOWNLOADS_BUFFERED, DOWNLOADS_FLUSH_INTERVAL, DOWNLOADS_FLUSH_SIZE
+from storage.models import StoredFile
+
+
+class DownloadCounter:
+    """
+        Aggregate download increments in memory and flush them to DB by batches:
+        one UPDATE per distinct increment value instead of one UPDATE per download
+    """
+
+    def __init__(self, flush_interval=DOWNLOADS_FLUSH_INTERVAL, flush_size=DOWNLOADS_FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.pending = Counter()
+        self.count = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add(self, pk: int):
+        with self.lock:
+            self.pending[pk] += 1
+            self.count += 1
+            due = self.count >= self.flush_size
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="download-counter", daemon=True)
+                self.thread.start()
+        if due:
+            self.flush()
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending, self.count = self.pending, Counter(), 0
+        if not pending:
+            return
+
+        by_increment = defaultdict(list)
+        for pk, n in pending.items():
+            by_increment[n].append(pk)
+        try:
+            # All increments are applied or none, so failed batch can be put back as a whole
+            with transaction.atomic():
+                for n, pks in by_increment.items():
+                    StoredFile.objects.filter(pk__in=pks).update(downloads=F("downloads") + n, downloaded_at=timezone.now())
+        except Exception as e:
+            logger.error(f"Action: flush download counters | {e}")
+            # Broken connection is dropped, next flush opens a new one
+            close_old_connections()
+            with self.lock:
+                self.pending.update(pending)
+                self.count += sum(pending.values())
+
+
+buffer = DownloadCounter() if DOWNLOADS_BUFFERED else None
+if buffer:
+    atexit.register(buffer.flush)
+
+
+def count_download(pk: int):
+    """ Atomically increment download counter of stored file (only 'downloads' and 'downloaded_at' are updated) """
+
+    if buffer:
+        buffer.add(pk)
+    else:
+        StoredFile.objects.filter(pk=pk).update(downloads=F("downloads") + 1, downloaded_at=timezone.now())
@@ -0,0 +1,331 @@
+import re
+import secrets
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+from back.settings import DOWNLOAD_CHUNK_SIZE, DOWNLOAD_MAX_RANGES, DOWNLOAD_BACKEND, DOWNLOAD_INTERNAL_URL
+from back.settings import DOWNLOAD_COMPRESS_SIDECARS
+from back.utils import not_modified, set_validators
+from storage.compression import CompressedChunks, may_compress, negotiate, sidecar_path
+from storage.counters import count_download
+from storage.frames import SeekTable, read_frames
+
+RANGE_RE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+class FileChunks:
+    """ Iterate over part of opened file by chunks, close file at the end of response """
+
+    def __init__(self, f, offset=0, length=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        self.file = f
+        self.offset = offset
+        self.length = length
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        return self.read(self.offset, self.length)
+
+    def read(self, offset, length):
+        self.file.seek(offset)
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            chunk = self.file.read(size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+class FrameChunks(FileChunks):
+    """ Iterate over part of content of file compressed at rest, only frames covering the part are read """
+
+    def __init__(self, f, offset=0, length=None):
+        super().__init__(f, offset, length)
+        self.table = SeekTable(f)
+
+    def read(self, offset, length):
+        return read_frames(self.file, offset, length, self.table)
+
+
+class MultipartChunks:
+    """ Iterate over several ranges of content as multipart/byteranges body """
+
+    def __init__(self, chunks, ranges, size, boundary):
+        self.chunks = chunks
+        self.ranges = ranges
+        self.size = size
+        self.boundary = boundary
+
+    def part_header(self, start, end) -> bytes:
+        return (f"--{self.boundary}\r\n"
+                f"Content-Type: application/octet-stream\r\n"
+                f"Content-Range: bytes {start}-{end}/{self.size}\r\n\r\n").encode()
+
+    def closing(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode()
+
+    def content_length(self) -> int:
+        return sum(len(self.part_header(s, e)) + e - s + 1 + 2 for s, e in self.ranges) + len(self.closing())
+
+    def __iter__(self):
+        for start, end in self.ranges:
+            yield self.part_header(start, end)
+            yield from self.chunks.read(start, end - start + 1)
+            yield b"\r\n"
+        yield self.closing()
+
+    def close(self):
+        self.chunks.close()
+
+
+def open_chunks(file, offset=0, length=None) -> FileChunks:
+    """ Open content of stored file (decompressed if it's compressed at rest) """
+    f = file.file.storage.open(file.file.name, "rb")
+    if not file.compressed:
+        return FileChunks(f, offset, length)
+    try:
+        return FrameChunks(f, offset, length)
+    except Exception:
+        f.close()
+        raise
+
+
+class AsyncChunks:
+    """
+        Async iterator over chunks of file for ASGI server, blocking reads are done in thread pool
+        thread_sensitive: chunks are read in the main sync thread (chunks are fetched from DB)
+    """
+
+    def __init__(self, chunks, thread_sensitive=False):
+        self.chunks = chunks
+        self.thread_sensitive = thread_sensitive
+
+    async def __aiter__(self):
+        iterator = iter(self.chunks)
+        read = sync_to_async(next, thread_sensitive=self.thread_sensitive)
+        while True:
+            chunk = await read(iterator, None)
+            if chunk is None:
+                break
+            yield chunk
+
+    def close(self):
+        self.chunks.close()
+
+
+def parse_range(header: str, size: int):
+    """
+        Parse 'Range: bytes=...' header (RFC 7233)
+        returns: list of (start, end) inclusive pairs, sorted and coalesced,
+                 [] if no range is satisfiable,
+                 None if header is invalid and must be ignored
+    """
+
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        match = RANGE_RE.match(spec)
+        if not match or match.groups() == ("", ""):
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        else:
+            start = max(size - int(last), 0)
+            end = size - 1
+            if int(last) == 0:
+                continue
+        if start < size:
+            ranges.append((start, end))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(header: str, etag: str, last_modified: int) -> bool:
+    """ Check If-Range validator: strong ETag or exact Last-Modified date """
+    header = header.strip()
+    if header.startswith('"'):
+        return header == etag
+    return parse_http_date_safe(header) == last_modified
+
+
+def offload_response(file) -> HttpResponse:
+    """ Empty response, the file itself is sent by web server (sendfile) or by object storage (redirect) """
+
+    if DOWNLOAD_BACKEND == "redirect":
+        return HttpResponseRedirect(file.file.storage.download_url(file.file.name, file.name))
+
+    response = HttpResponse()
+    if DOWNLOAD_BACKEND == "x-accel-redirect":
+        response["X-Accel-Redirect"] = quote(f"{DOWNLOAD_INTERNAL_URL.rstrip('/')}/{file.file.name}")
+    else:
+        response["X-Sendfile"] = file.file.path
+    response["Content-Type"] = "application/octet-stream"
+    return response
+
+
+def stream_response(request, file, is_async=False):
+    """
+        Stream stored file to client without loading it into memory
+        Supports single and multiple byte ranges, If-Range
+        is_async: file is streamed by async iterator (ASGI)
+        returns: response and list of sent ranges (None for whole file)
+    """
+
+    size = file.size_bytes
+
+    ranges = None
+    header = request.META.get("HTTP_RANGE")
+    if header and (
+            "HTTP_IF_RANGE" not in request.META
+            or if_range_matches(request.META["HTTP_IF_RANGE"], file.etag, file.last_modified)):
+        ranges = parse_range(header, size)
+        if ranges and len(ranges) > DOWNLOAD_MAX_RANGES:
+            ranges = None
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        response["Accept-Ranges"] = "bytes"
+        return response, ranges
+
+    if not ranges:
+        content = open_chunks(file)
+        headers = {"Content-Type": "application/octet-stream", "Content-Length": size}
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        content = open_chunks(file, start, end - start + 1)
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "Content-Length": end - start + 1,
+            "Content-Range": f"bytes {start}-{end}/{size}",
+        }
+    else:
+        content = MultipartChunks(open_chunks(file), ranges, size, secrets.token_hex(16))
+        headers = {
+            "Content-Type": f"multipart/byteranges; boundary={content.boundary}",
+            "Content-Length": content.content_length(),
+        }
+
+    response = StreamingHttpResponse(
+        AsyncChunks(content) if is_async else content, status=206 if ranges else 200, headers=headers)
+    response["Accept-Ranges"] = "bytes"
+    return response, ranges
+
+
+def compressed_response(file, encoding: str, is_async=False):
+    """ Whole file in content encoding: precompressed copy if it was built, else compressed on the fly """
+
+    headers = {"Content-Type": "application/octet-stream", "Content-Encoding": encoding}
+    content = None
+    if file.compressed and encoding == "zstd":
+        # Content compressed at rest is valid zstd stream itself
+        f = file.file.storage.open(file.file.name, "rb")
+        content = FileChunks(f)
+        headers["Content-Length"] = f.size
+    elif file.sha256 and encoding in DOWNLOAD_COMPRESS_SIDECARS:
+        try:
+            f = default_storage.open(sidecar_path(file.sha256, encoding), "rb")
+            content = FileChunks(f)
+            headers["Content-Length"] = f.size
+        except FileNotFoundError:
+            pass
+    if content is None:
+        content = CompressedChunks(open_chunks(file), encoding)
+
+    return StreamingHttpResponse(AsyncChunks(content) if is_async else content, headers=headers)
+
+
+def file_response(request, file, encoding=None, is_async=False):
+    """ returns: response by configured DOWNLOAD_BACKEND and list of requested ranges """
+
+    # Content compressed at rest can't be sent by web server or storage as is
+    if DOWNLOAD_BACKEND in ("x-accel-redirect", "x-sendfile", "redirect") and not file.compressed:
+        # Web server (storage) handles Range requests itself, just look at requested ranges for download counter
+        return offload_response(file), parse_range(request.META.get("HTTP_RANGE", ""), file.size_bytes)
+    if encoding:
+        return compressed_response(file, encoding, is_async), None
+    return stream_response(request, file, is_async)
+
+
+def check_conditions(request, file):
+    """
+        Choose content encoding and check conditional request for chosen representation of file
+        returns: (encoding, ETag, 304/412 response or None)
+    """
+
+    encoding = negotiate(request, file)
+    # Every encoding of file is a separate representation with its own ETag
+    etag = f'{file.etag[:-1]}-{encoding}"' if encoding else file.etag
+    response = not_modified(request, etag, file.last_modified)
+    if response and may_compress(file):
+        patch_vary_headers(response, ["Accept-Encoding"])
+    return encoding, etag, response
+
+
+def attach_file(response, file, ranges, etag) -> bool:
+    """
+        Set headers of downloaded file
+        returns: True if it's a new download (partial requests for the tail of file - resume,
+                 parallel segments - are not counted as new downloads)
+    """
+
+    response["Content-Disposition"] = f"attachment; filename='{file.name}'"
+    set_validators(response, etag, file.last_modified)
+    if may_compress(file):
+        patch_vary_headers(response, ["Accept-Encoding"])
+    return not ranges or ranges[0][0] == 0
+
+
+def send_file(request, file) -> HttpResponse:
+    """ Send stored file to client by configured DOWNLOAD_BACKEND """
+
+    # Conditional request for unchanged file is answered without opening it
+    encoding, etag, response = check_conditions(request, file)
+    if response:
+        return response
+
+    response, ranges = file_response(request, file, encoding)
+    if ranges == []:
+        return response
+    if attach_file(response, file, ranges, etag):
+        count_download(file.pk)
+    return response
+
+
+async def asend_file(request, file) -> HttpResponse:
+    """ Async version of send_file, file isn't opened or read in event loop """
+
+    encoding, etag, response = check_conditions(request, file)
+    if response:
+        return response
+
+    response, ranges = await sync_to_async(file_response, thread_sensitive=False)(request, file, encoding, True)
+    if ranges == []:
+        return response
+    if attach_file(response, file, ranges, etag):
+        await sync_to_async(count_download)(file.pk)
+    return response
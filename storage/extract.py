@@ -0,0 +1,243 @@
+"""
+    Extraction of uploaded zip/tar archive into separate stored files:
+    archive is listed first (declared sizes are checked against limits and quota),
+    members are read one by one into temp files (with limits checked on actually read bytes),
+    put into storage by pool of threads and saved to DB by one bulk insert
+"""
+import hashlib
+import os
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.db import connection, transaction
+
+from back.settings import UPLOAD_DIR, UPLOAD_CHUNK_SIZE
+from back.settings import EXTRACT_MAX_MEMBERS, EXTRACT_MAX_SIZE, EXTRACT_MAX_RATIO, EXTRACT_WORKERS
+from back.utils import valid_filename
+from storage.models import StoredFile, Link, file_path
+from storage.uploads import PartFile, upload_dir
+from users.models import User
+
+
+class ExtractError(Exception):
+    """ Archive can't be extracted: it's invalid or exceeds limits """
+
+
+class Archive:
+    """
+        Zip or tar (optionally compressed) archive opened for extraction
+        files: regular files as (path in archive, size declared in archive, member) - listed before anything
+               is extracted, so declared sizes are checked against limits and quota first
+    """
+
+    def __init__(self, f, limit: int, limit_error: str):
+        self.archive = None
+        self.files = []
+        self.limit, self.limit_error, self.total = limit, limit_error, 0
+        try:
+            if zipfile.is_zipfile(f):
+                f.seek(0)
+                self.archive = zipfile.ZipFile(f)
+                for info in self.archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if info.file_size > max(info.compress_size, 1) * EXTRACT_MAX_RATIO:
+                        raise ExtractError(f"Suspicious compression ratio of '{info.filename}'")
+                    self.add(info.filename, info.file_size, info)
+            else:
+                f.seek(0)
+                try:
+                    # Headers are read only, content of members is skipped (compressed tar is decompressed once)
+                    self.archive = tarfile.open(fileobj=f, mode="r:*")
+                except tarfile.ReadError:
+                    raise ExtractError("Invalid archive (not a zip or tar file)")
+                for member in iter(self.archive.next, None):
+                    if member.isfile():
+                        self.add(member.name, member.size, member)
+        except (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError) as e:
+            self.close()
+            raise ExtractError(f"Invalid archive ({e})")
+        except BaseException:
+            self.close()
+            raise
+
+    def add(self, path: str, size: int, member):
+        self.total += size
+        if self.total > self.limit:
+            raise ExtractError(self.limit_error)
+        if len(self.files) >= EXTRACT_MAX_MEMBERS:
+            raise ExtractError(f"Too many files in archive (max {EXTRACT_MAX_MEMBERS})")
+        self.files.append((path, size, member))
+
+    def open(self, member):
+        """ Stream of member's content """
+        if isinstance(self.archive, zipfile.ZipFile):
+            return self.archive.open(member)
+        return self.archive.extractfile(member)
+
+    def close(self):
+        if self.archive:
+            self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spool(src, size: int, limit: int, limit_error: str):
+    """
+        Copy member's content into temp file (on the same file system as storage) computing its hash
+        size: size declared in archive, limit: max number of bytes to read
+        returns: (path of temp file, size, sha256)
+    """
+
+    hash = hashlib.sha256()
+    received = 0
+    fd, path = tempfile.mkstemp(dir=upload_dir(), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            while chunk := src.read(UPLOAD_CHUNK_SIZE):
+                received += len(chunk)
+                # Declared sizes are checked by limits, but the content may be longer than declared
+                if received > limit:
+                    raise ExtractError(limit_error)
+                if received > size:
+                    raise ExtractError("Invalid archive (content is longer than declared)")
+                hash.update(chunk)
+                dst.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, received, hash.hexdigest()
+
+
+def place(file, path: str, sha256: str, pending: bool):
+    """ Put content of extracted file into storage (in worker thread), pending - see set_content """
+
+    content = PartFile(path, file.name)
+    try:
+        file.set_content(content, sha256, commit=True, pending=pending)
+    finally:
+        content.close()
+        if os.path.exists(path):
+            os.remove(path)
+        # Blobs (STORAGE_DEDUP) are stored by worker's own DB connection
+        connection.close()
+
+
+def discard(files):
+    """ Release contents of extracted files that aren't saved """
+    with transaction.atomic():
+        [file.release_content() for file in files if file.file.name]
+
+
+def extract_upload(owner, upload, description="", force=False) -> list:
+    """
+        Store regular files of uploaded archive as owner's files, files are named by base names of members
+        force: rewrite existing files (content is replaced in place, see StoredFile.replace_content)
+        returns: list of results per member (stored file or error), raises ExtractError
+    """
+
+    limit = min(EXTRACT_MAX_SIZE, upload.size * EXTRACT_MAX_RATIO)
+    limit_error = f"Extracted files exceed limit ({limit} bytes)"
+    # Result per member: error or name of extracted file (resolved when files are saved)
+    results, planned, outcome = [], [], {}
+    extracted, pending = [], set()
+    try:
+        with Archive(upload.file, limit, limit_error) as archive:
+            for path, size, member in archive.files:
+                name = path.rstrip("/").rsplit("/", 1)[-1]
+                if not valid_filename(name):
+                    results.append({"name": name, "error": 400, "error_msg": f"Invalid filename - '{name}'"})
+                elif name in outcome:
+                    results.append({"name": name, "error": 400, "error_msg": f"Duplicate file '{name}'"})
+                else:
+                    outcome[name] = None
+                    results.append(name)
+                    planned.append((name, size, member))
+
+            # Quota is checked by declared sizes before anything is extracted (and rechecked on save)
+            exist = dict(owner.files.filter(name__in=list(outcome)).values_list("name", "size_bytes"))
+            if not force:
+                planned = [p for p in planned if p[0] not in exist]
+                exist = {}
+            err = owner.quota_error(
+                len(planned) - len(exist), sum(size for _, size, _ in planned) - sum(exist.values()))
+            if err:
+                raise ExtractError(err)
+
+            with ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as pool:
+                try:
+                    total = 0
+                    for name, size, member in planned:
+                        with archive.open(member) as src:
+                            part, size, sha256 = spool(src, size, limit - total, limit_error)
+                        total += size
+                        file = StoredFile(name=name, owner=owner, description=description)
+                        extracted.append(file)
+                        # Number of extracted but not yet stored files is bounded
+                        if len(pending) >= EXTRACT_WORKERS * 2:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            [f.result() for f in done]
+                        # Replacing content is put aside to be renamed in place of the current one
+                        pending.add(pool.submit(place, file, part, sha256, name in exist))
+                except (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError) as e:
+                    raise ExtractError(f"Invalid archive ({e})")
+            [f.result() for f in pending]
+
+        with transaction.atomic():
+            # Owner's row is locked, so quota and existing names are checked against concurrent uploads
+            owner = User.objects.select_for_update().get(pk=owner.pk)
+            names = [f.name for f in extracted]
+            exist = {f.name: f for f in owner.files.filter(name__in=names).select_related("owner", "blob")}
+            files = extracted
+            if exist and not force:
+                # Files created meanwhile aren't overwritten
+                rejected = [f for f in extracted if f.name in exist]
+                files = [f for f in extracted if f.name not in exist]
+                transaction.on_commit(lambda: discard(rejected))
+                exist = {}
+            created = [f for f in files if f.name not in exist]
+            replaced = [f for f in files if f.name in exist]
+            size = sum(f.size_bytes for f in files) - sum(exist[f.name].size_bytes for f in replaced)
+            err = owner.quota_error(len(created), size)
+            if err:
+                raise ExtractError(err)
+
+            for file in created:
+                if file.file.name.startswith(f"{UPLOAD_DIR}/"):
+                    # Replaced file was deleted meanwhile, put aside content is moved to its own path
+                    name = file_path(owner.uuid, file.name)
+                    file.file.storage.move(file.file.name, name)
+                    file.file.name = name
+            StoredFile.objects.bulk_create(created)
+            for file in created:
+                outcome[file.name] = {"name": file.name, "ok": 201, "file": file.serializer}
+
+            for new in replaced:
+                file = exist[new.name]
+                file.forget_links()
+                Link.objects.filter(to_file=file).delete()
+                file.replace_content(new)
+                file.description = description or file.description
+                file.downloads = 0
+                file.save()
+                outcome[file.name] = {"name": file.name, "ok": 200, "file": file.serializer}
+                # Content belongs to replaced file now, it isn't discarded with the new one
+                new.file = None
+            owner.add_usage(len(created), size)
+            [f.compress_content() for f in created + [exist[f.name] for f in replaced]]
+    except BaseException:
+        discard(extracted)
+        raise
+
+    return [
+        r if isinstance(r, dict)
+        else outcome[r] or {"name": r, "error": 400, "error_msg": f"File '{r}' already exists!"}
+        for r in results
+    ]
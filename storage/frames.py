@@ -0,0 +1,107 @@
+"""
+    Compressed storage of content in zstd seekable format:
+    content is split into independently compressed frames followed by seek table
+    (skippable frame, so the whole file is still valid zstd stream),
+    any byte range is read by decompressing only frames it covers
+"""
+import bisect
+import os
+import struct
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from django.core.exceptions import ImproperlyConfigured
+
+from back.settings import STORAGE_COMPRESSION, STORAGE_COMPRESSION_LEVEL, STORAGE_FRAME_SIZE
+from storage.uploads import PartFile, upload_dir
+
+if STORAGE_COMPRESSION and not zstandard:
+    raise ImproperlyConfigured("STORAGE_COMPRESSION=True needs zstandard package: pip install zstandard")
+
+SKIPPABLE_MAGIC = 0x184D2A5E
+SEEKABLE_MAGIC = 0x8F92EAB1
+# Seek table entry: compressed size, decompressed size (checksum is optional)
+ENTRY = struct.Struct("<II")
+# Seek table footer: number of frames, descriptor, magic
+FOOTER = struct.Struct("<IBI")
+# Content is stored compressed only if it saves at least 5% of space
+MAX_RATIO = 0.95
+
+
+def compress_frames(chunks, dst, level=STORAGE_COMPRESSION_LEVEL) -> bool:
+    """
+        Write chunks (frame by frame) to dst file in seekable format
+        returns: False if content is incompressible (checked by the first frame)
+    """
+
+    compressor = zstandard.ZstdCompressor(level=level)
+    entries = []
+    for data in chunks:
+        frame = compressor.compress(data)
+        if not entries and len(frame) > len(data) * MAX_RATIO:
+            return False
+        dst.write(frame)
+        entries.append(ENTRY.pack(len(frame), len(data)))
+
+    table = b"".join(entries) + FOOTER.pack(len(entries), 0, SEEKABLE_MAGIC)
+    dst.write(struct.pack("<II", SKIPPABLE_MAGIC, len(table)) + table)
+    return True
+
+
+def pack(content):
+    """
+        Compress uploaded content into temp file (on the same file system as storage, to be moved by rename)
+        returns: compressed file or None if compression doesn't save space
+    """
+
+    fd, path = tempfile.mkstemp(dir=upload_dir(), suffix=".zst")
+    with os.fdopen(fd, "wb") as dst:
+        packed = compress_frames(content.chunks(STORAGE_FRAME_SIZE), dst)
+    if packed and os.path.getsize(path) <= content.size * MAX_RATIO:
+        return PartFile(path, content.name)
+    os.remove(path)
+    return None
+
+
+class SeekTable:
+    """ Frame index of seekable file: offsets of frames in compressed file and in content """
+
+    def __init__(self, f):
+        f.seek(-FOOTER.size, os.SEEK_END)
+        frames, descriptor, magic = FOOTER.unpack(f.read(FOOTER.size))
+        if magic != SEEKABLE_MAGIC:
+            raise ValueError("Not a seekable zstd file")
+
+        entry_size = ENTRY.size + (4 if descriptor & 0x80 else 0)
+        f.seek(-(FOOTER.size + frames * entry_size), os.SEEK_END)
+        raw = f.read(frames * entry_size)
+        self.offsets = [0]
+        self.positions = [0]
+        for i in range(frames):
+            compressed, size = ENTRY.unpack_from(raw, i * entry_size)
+            self.offsets.append(self.offsets[-1] + compressed)
+            self.positions.append(self.positions[-1] + size)
+
+    @property
+    def size(self) -> int:
+        return self.positions[-1]
+
+
+def read_frames(f, offset=0, length=None, table=None):
+    """ Iterate over decompressed bytes [offset, offset + length) of seekable file, frame by frame """
+
+    table = table or SeekTable(f)
+    end = table.size if length is None else min(table.size, offset + length)
+    decompressor = zstandard.ZstdDecompressor()
+    i = bisect.bisect_right(table.positions, offset) - 1
+    while offset < end:
+        f.seek(table.offsets[i])
+        data = decompressor.decompress(f.read(table.offsets[i + 1] - table.offsets[i]))
+        piece = data[offset - table.positions[i]:end - table.positions[i]]
+        yield piece
+        offset += len(piece)
+        i += 1
@@ -0,0 +1,49 @@
+import time
+import uuid
+
+from django.db import transaction
+from django.http import JsonResponse as DjangoJsonResponse
+from django.core.management.base import BaseCommand
+
+from back.utils import json_stream, JsonResponse
+from storage.models import StoredFile, FILE_FIELDS, file_columns, serialize_rows
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ("Benchmark of file list serialization: model instances with serializer properties encoded "
+            "by django JsonResponse vs values_list rows encoded by fast encoder (whole and streamed)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--files", type=int, nargs="+", default=[10000, 100000], help="Numbers of files")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per method, the best one is reported")
+
+    def handle(self, *args, **options):
+        methods = {
+            "serializer": lambda files: DjangoJsonResponse(
+                {"ok": 200, "files": [f.serialize(FILE_FIELDS) for f in files.only(*file_columns(), "owner")]}),
+            "values": lambda files: JsonResponse(
+                {"ok": 200, "files": list(serialize_rows(files.values_list(*file_columns())))}),
+            "stream": lambda files: sum(len(chunk) for chunk in json_stream(
+                {"ok": 200}, "files", serialize_rows(files.values_list(*file_columns()).iterator(chunk_size=2000)))),
+        }
+
+        for count in options["files"]:
+            # Rows are created in transaction which is rolled back at the end
+            with transaction.atomic():
+                user = User.objects.create_user(f"bench{uuid.uuid4().hex[:12]}")
+                StoredFile.objects.bulk_create(
+                    [StoredFile(owner=user, name=f"file{i}.txt", file=f"{user.uuid}/file{i}.txt", size_bytes=i)
+                     for i in range(count)], batch_size=5000)
+                files = user.files.order_by("name", "id")
+
+                results = []
+                for name, method in methods.items():
+                    times = []
+                    for _ in range(options["repeat"]):
+                        start = time.perf_counter()
+                        method(files)
+                        times.append(time.perf_counter() - start)
+                    results.append(f"{name} {min(times) * 1000:.0f} ms")
+                self.stdout.write(f"{count} files: " + ", ".join(results))
+                transaction.set_rollback(True)
@@ -0,0 +1,81 @@
+import hashlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.http.multipartparser import MultiPartParser
+from django.core.files.uploadhandler import FileUploadHandler, MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+from back.settings import STORAGE_DIR
+from storage.uploads import StorageUploadHandler
+
+BOUNDARY = "benchmarkboundary"
+
+
+class HashUploadHandler(FileUploadHandler):
+    """ Compute SHA-256 of uploaded file while it is streamed in (hashing pass of default upload path) """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.hash = None
+        self.sha256 = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hash = hashlib.sha256()
+        self.sha256 = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.sha256 = self.hash.hexdigest()
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Benchmark of upload path: multipart body is parsed and saved to storage by default handlers "
+            "(temp file in system temp dir) and by StorageUploadHandler (temp file in storage)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=64, help="Size of uploaded file, MiB")
+        parser.add_argument("--count", type=int, default=5, help="Number of uploads per path")
+
+    def handle(self, *args, **options):
+        size = options["size"] * 1024 * 1024
+        body = (f"--{BOUNDARY}\r\n"
+                f'Content-Disposition: form-data; name="file"; filename="bench.bin"\r\n'
+                f"Content-Type: application/octet-stream\r\n\r\n").encode()
+        body += os.urandom(size) + f"\r\n--{BOUNDARY}--\r\n".encode()
+        meta = {"CONTENT_TYPE": f"multipart/form-data; boundary={BOUNDARY}", "CONTENT_LENGTH": str(len(body))}
+
+        os.makedirs(STORAGE_DIR, exist_ok=True)
+        same_fs = os.stat(tempfile.gettempdir()).st_dev == os.stat(STORAGE_DIR).st_dev
+        self.stdout.write(f"Upload of {options['size']} MiB, system temp dir and storage are on "
+                          f"{'the same' if same_fs else 'different'} file systems")
+
+        paths = {
+            "default": lambda: [HashUploadHandler(), MemoryFileUploadHandler(), TemporaryFileUploadHandler()],
+            "storage": lambda: [StorageUploadHandler()],
+        }
+        for name, handlers in paths.items():
+            times = []
+            for i in range(options["count"]):
+                start = time.perf_counter()
+                _, files = MultiPartParser(meta, io.BytesIO(body), handlers()).parse()
+                file = files["file"]
+                saved = default_storage.save(f".bench/{name}-{i}", file)
+                file.close()
+                times.append(time.perf_counter() - start)
+                default_storage.delete(saved)
+
+            mean = statistics.mean(times)
+            self.stdout.write(
+                f"{name:8} latency: mean {mean * 1000:.0f} ms, min {min(times) * 1000:.0f} ms, "
+                f"max {max(times) * 1000:.0f} ms | throughput {size / mean / 1024 / 1024:.0f} MiB/s")
+        default_storage.remove_dir(".bench")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from storage.frames import SeekTable
+from storage.models import StoredFile
+
+
+class Command(BaseCommand):
+    help = "Check consistency of stored files: report missing files and sizes on disk differing from DB"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix-sizes", action="store_true", help="Update stored sizes from disk")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of rows fetched per query")
+
+    def handle(self, *args, **options):
+        missing = mismatched = 0
+        for file in StoredFile.objects.select_related("owner").iterator(chunk_size=options["batch_size"]):
+            if not file.exists:
+                missing += 1
+                self.stdout.write(f"Missing: {file.pk}: {file.owner}/{file.name} ({file.file.name})")
+                continue
+
+            size = file.file.storage.size(file.file.name)
+            if size != file.disk_bytes:
+                mismatched += 1
+                self.stdout.write(f"Size mismatch: {file.pk}: {file.owner}/{file.name} | DB {file.disk_bytes}, disk {size}")
+                if options["fix_sizes"]:
+                    # Size of content compressed at rest is known only from its seek table
+                    if file.compressed:
+                        with file.file.storage.open(file.file.name, "rb") as f:
+                            content_size = SeekTable(f).size
+                    else:
+                        content_size = size
+                    StoredFile.objects.filter(pk=file.pk).update(size_bytes=content_size, disk_bytes=size)
+
+        self.stdout.write(f"Missing files: {missing}, size mismatches: {mismatched}" +
+                          (" (fixed)" if options["fix_sizes"] and mismatched else ""))
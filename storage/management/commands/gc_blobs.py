@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from storage.models import Blob
+
+
+class Command(BaseCommand):
+    help = ("Recount references of content blobs and delete blobs not used by any stored file. "
+            "Blob reference is taken before the file row is committed, so run it while uploads are stopped; "
+            "blobs younger than --min-age are skipped anyway")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-age", type=float, default=3600,
+                            help="Skip blobs created less than N seconds ago (their uploads may be in progress)")
+
+    def handle(self, *args, **options):
+        created_before = datetime.now(timezone.utc) - timedelta(seconds=options["min_age"])
+        blobs = Blob.objects.filter(Q(created_at__isnull=True) | Q(created_at__lt=created_before))
+        fixed = deleted = 0
+        for blob in blobs.annotate(used=Count("files")).iterator():
+            with transaction.atomic():
+                if blob.used:
+                    if blob.used != blob.refs:
+                        Blob.objects.filter(pk=blob.pk).update(refs=blob.used)
+                        fixed += 1
+                elif Blob.objects.filter(pk=blob.pk, files__isnull=True).delete()[0]:
+                    transaction.on_commit(lambda b=blob: b.file.delete(save=False))
+                    deleted += 1
+        self.stdout.write(f"Blobs with fixed references: {fixed}, orphaned blobs deleted: {deleted}")
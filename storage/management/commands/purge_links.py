@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from storage.models import Link
+
+
+class Command(BaseCommand):
+    help = "Delete expired download links by batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of links deleted per query")
+        parser.add_argument("--pause", type=float, default=0, help="Pause between batches (seconds)")
+        parser.add_argument("--loop", type=float, default=0,
+                            help="Run as periodic sweeper: repeat purge every N seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = self.purge(options["batch_size"], options["pause"])
+            self.stdout.write(f"Expired links deleted: {deleted}")
+            if not options["loop"]:
+                break
+            time.sleep(options["loop"])
+
+    @staticmethod
+    def purge(batch_size: int, pause: float) -> int:
+        deleted = 0
+        while True:
+            pks = list(Link.expired_links().values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                return deleted
+            # Total count of delete() includes rows of bundle links' files
+            deleted += Link.objects.filter(pk__in=pks).delete()[1].get("storage.Link", 0)
+            if pause:
+                time.sleep(pause)
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from storage.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "Delete expired (abandoned) upload sessions with their part files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", type=float, default=0,
+                            help="Run as periodic sweeper: repeat purge every N seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = UploadSession.purge(UploadSession.objects.all())
+            self.stdout.write(f"Expired upload sessions deleted: {deleted}")
+            if not options["loop"]:
+                break
+            time.sleep(options["loop"])
@@ -0,0 +1,68 @@
+import time
+from collections import deque
+
+from django.core.management.base import BaseCommand
+
+from back.settings import STORAGE_FANOUT
+from storage.models import StoredFile, file_path
+
+
+class Command(BaseCommand):
+    help = "Move stored files to current directory layout (STORAGE_FANOUT) by batches, service may keep running"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of files moved per batch")
+        parser.add_argument("--pause", type=float, default=1,
+                            help="Pause (seconds) before old names of moved batch are removed "
+                                 "(requests that have just read old name can still open it)")
+        parser.add_argument("--fanout", type=int, default=STORAGE_FANOUT, help="Levels of hashed fan-out dirs")
+
+    def handle(self, *args, **options):
+        pause = options["pause"]
+        moved = skipped = last = 0
+        removals = deque()
+        while True:
+            files = list(
+                StoredFile.objects.filter(blob__isnull=True, pk__gt=last).order_by("pk")
+                .select_related("owner").only("pk", "file", "owner__uuid")[:options["batch_size"]])
+            if not files:
+                break
+            last = files[-1].pk
+
+            done = []
+            for file in files:
+                old = file.file.name
+                new = file_path(file.owner.uuid, old.rsplit("/", 1)[-1], options["fanout"])
+                if old == new or not file.exists:
+                    continue
+                storage = file.file.storage
+                # New name is linked first, row is switched only if file wasn't changed meanwhile
+                storage.copy(old, new)
+                if StoredFile.objects.filter(pk=file.pk, file=old).update(file=new):
+                    file.forget_links()
+                    done.append((storage, old))
+                else:
+                    storage.delete(new)
+                    storage.remove_dir(new.rsplit("/", 1)[0])
+                    skipped += 1
+
+            # Old names of batch are removed after pause, next batches are moved meanwhile
+            if done:
+                removals.append((time.monotonic() + pause, done))
+            while removals and removals[0][0] <= time.monotonic():
+                self.remove(removals.popleft()[1])
+            moved += len(done)
+            self.stdout.write(f"Moved files: {moved}")
+
+        for due, done in removals:
+            time.sleep(max(due - time.monotonic(), 0))
+            self.remove(done)
+        self.stdout.write(f"Moved files: {moved}, skipped (changed while moving): {skipped}")
+
+    @staticmethod
+    def remove(done: list):
+        """ Remove old names of moved files and their dirs that get empty """
+        for storage, old in done:
+            storage.delete(old)
+        for storage, old_dir in {(storage, old.rsplit("/", 1)[0]) for storage, old in done}:
+            storage.remove_dir(old_dir)
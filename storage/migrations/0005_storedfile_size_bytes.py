@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:41
+
+import os
+
+from django.db import migrations, models
+import storage.models
+
+
+def fill_size_bytes(apps, schema_editor):
+    StoredFile = apps.get_model("storage", "StoredFile")
+    for file in StoredFile.objects.all().iterator():
+        if file.file and os.path.exists(file.file.path):
+            file.size_bytes = file.file.size
+            file.save(update_fields=["size_bytes"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0004_alter_link_href"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storedfile",
+            name="size_bytes",
+            field=models.BigIntegerField(default=0, verbose_name="Size"),
+        ),
+        migrations.RunPython(fill_size_bytes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="link",
+            name="href",
+            field=models.CharField(
+                default=storage.models.generate_href,
+                editable=False,
+                max_length=16,
+                unique=True,
+                verbose_name="Href",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="storedfile",
+            name="downloads",
+            field=models.IntegerField(default=0, verbose_name="Downloads"),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0005_storedfile_size_bytes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="storedfile",
+            index=models.Index(
+                fields=["owner", "name", "id"], name="storedfile_owner_name_id"
+            ),
+        ),
+    ]
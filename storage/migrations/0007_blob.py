@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import storage.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0006_storedfile_owner_name_id_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Blob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "sha256",
+                    models.CharField(
+                        max_length=64, unique=True, verbose_name="SHA-256"
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        max_length=256,
+                        upload_to=storage.models.blob_path,
+                        verbose_name="File",
+                    ),
+                ),
+                ("size_bytes", models.BigIntegerField(default=0, verbose_name="Size")),
+                ("refs", models.IntegerField(default=0, verbose_name="References")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, null=True, verbose_name="Created at"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Blob",
+                "verbose_name_plural": "Blobs",
+                "ordering": ["pk"],
+            },
+        ),
+        migrations.AddField(
+            model_name="storedfile",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="files",
+                to="storage.blob",
+                verbose_name="Blob",
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("storage", "0007_blob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadSession",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=512, verbose_name="Name")),
+                (
+                    "description",
+                    models.CharField(
+                        default="", max_length=512, verbose_name="Description"
+                    ),
+                ),
+                ("size_bytes", models.BigIntegerField(verbose_name="Size")),
+                ("sha256", models.CharField(max_length=64, verbose_name="SHA-256")),
+                ("force", models.BooleanField(default=False, verbose_name="Force")),
+                (
+                    "received",
+                    models.JSONField(default=list, verbose_name="Received ranges"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, null=True, verbose_name="Created at"
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="uploads",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Owner",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Upload Session",
+                "verbose_name_plural": "Upload Sessions",
+                "ordering": ["created_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0008_uploadsession"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="link",
+            name="expire_at",
+            field=models.DateTimeField(
+                db_index=True, null=True, verbose_name="Expire at"
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:51
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_sha256(apps, schema_editor):
+    # Checksum of blob-backed files is known, other files keep id/size/mtime based ETag
+    StoredFile = apps.get_model("storage", "StoredFile")
+    Blob = apps.get_model("storage", "Blob")
+    StoredFile.objects.filter(blob__isnull=False).update(
+        sha256=Subquery(Blob.objects.filter(pk=OuterRef("blob_id")).values("sha256")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0009_link_expire_at_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storedfile",
+            name="sha256",
+            field=models.CharField(
+                blank=True, default="", max_length=64, verbose_name="SHA-256"
+            ),
+        ),
+        migrations.RunPython(fill_sha256, migrations.RunPython.noop),
+    ]
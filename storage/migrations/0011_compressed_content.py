@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:00
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_disk_bytes(apps, schema_editor):
+    # Existing content is stored uncompressed
+    for model in ("Blob", "StoredFile"):
+        apps.get_model("storage", model).objects.update(disk_bytes=F("size_bytes"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0010_storedfile_sha256"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blob",
+            name="compressed",
+            field=models.BooleanField(default=False, verbose_name="Compressed"),
+        ),
+        migrations.AddField(
+            model_name="blob",
+            name="disk_bytes",
+            field=models.BigIntegerField(default=0, verbose_name="Size on disk"),
+        ),
+        migrations.AddField(
+            model_name="storedfile",
+            name="compressed",
+            field=models.BooleanField(default=False, verbose_name="Compressed"),
+        ),
+        migrations.AddField(
+            model_name="storedfile",
+            name="disk_bytes",
+            field=models.BigIntegerField(default=0, verbose_name="Size on disk"),
+        ),
+        migrations.RunPython(fill_disk_bytes, migrations.RunPython.noop),
+    ]
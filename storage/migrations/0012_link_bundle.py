@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("storage", "0011_compressed_content"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="link",
+            name="all_files",
+            field=models.BooleanField(default=False, verbose_name="All files of owner"),
+        ),
+        migrations.AddField(
+            model_name="link",
+            name="archive",
+            field=models.CharField(
+                blank=True, default="", max_length=3, verbose_name="Archive format"
+            ),
+        ),
+        migrations.AddField(
+            model_name="link",
+            name="files",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="bundle_links",
+                to="storage.storedfile",
+                verbose_name="Files",
+            ),
+        ),
+        migrations.AddField(
+            model_name="link",
+            name="owner",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="bundle_links",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Owner",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="link",
+            name="to_file",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="links",
+                to="storage.storedfile",
+                verbose_name="To file",
+            ),
+        ),
+    ]
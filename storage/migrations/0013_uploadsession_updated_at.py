@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:35
+
+from django.db import migrations, models
+
+
+def fill_updated_at(apps, schema_editor):
+    UploadSession = apps.get_model("storage", "UploadSession")
+    UploadSession.objects.update(updated_at=models.F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0012_link_bundle"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsession",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, null=True, verbose_name="Updated at"
+            ),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("storage", "0013_uploadsession_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storedfile",
+            name="downloaded_at",
+            field=models.DateTimeField(
+                editable=False, null=True, verbose_name="Downloaded at"
+            ),
+        ),
+    ]
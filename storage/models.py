@@ -1,64 +1,430 @@
+import hashlib
 import os
+import re
 import secrets
-from datetime import datetime, timezone
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
 
-from back.settings import STORAGE_DIR, BASE_URL
+from back.settings import BASE_URL, STORAGE_DEDUP, LINK_CACHE_TTL, LINK_MISS_TTL
+from back.settings import UPLOAD_DIR, UPLOAD_SESSION_TTL
+from back.settings import logger, DOWNLOAD_COMPRESS_SIDECARS, STORAGE_COMPRESSION, STORAGE_FANOUT, BULK_DELETE_WORKERS
 from back.utils import valid_filename
+from storage.cache import link_cache, miss_cache, forget_links
+from storage.compression import build_sidecars, remove_sidecars
+from storage.frames import pack
+from storage.uploads import upload_dir
 from users.models import User
 
 
 def owner_file_path(instance, filename):
-    return f"{instance.owner.uuid}/{filename}"
+    return file_path(instance.owner.uuid, filename)
+
+
+def file_path(owner_uuid, filename: str, fanout=STORAGE_FANOUT) -> str:
+    """ Name of user's file in storage: <user uuid>/<file> under hashed fan-out dirs (ab/cd/...) """
+    name = f"{owner_uuid}/{filename}"
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return "/".join([digest[i * 2:i * 2 + 2] for i in range(fanout)] + [name])
+
+
+def delete_files(storage, names, dirs=()):
+    """ Delete files from storage by pool of threads, then empty dirs (fan-out dirs) """
+
+    def delete(name):
+        try:
+            storage.delete(name)
+        except OSError as e:
+            logger.error(f"Action: delete {name} | {e}")
+
+    with ThreadPoolExecutor(max_workers=BULK_DELETE_WORKERS) as pool:
+        list(pool.map(delete, names))
+    for name in dirs:
+        storage.remove_dir(name)
+
+
+def delete_on_commit(storage, name: str):
+    """ Delete own file from storage after commit """
+    transaction.on_commit(lambda: storage.delete(name))
+    if STORAGE_FANOUT and not name.startswith(f"{UPLOAD_DIR}/"):
+        # Fan-out dir of user holds few files, it's removed when it gets empty
+        transaction.on_commit(lambda: storage.remove_dir(name.rsplit("/", 1)[0]))
+
+
+def blob_path(instance, filename):
+    return f"blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}"
 
 
 def generate_href():
     return secrets.token_urlsafe(12)
 
 
+HREF_RE = re.compile(r"^[A-Za-z0-9_-]{16}$")
+
+
+# Fields of stored file filled from its content
+CONTENT_FIELDS = ["size_bytes", "disk_bytes", "sha256", "compressed", "blob"]
+
+# Serialized file fields: name in API -> (model field, converter)
+FILE_FIELDS = {
+    "id": ("id", None),
+    "name": ("name", None),
+    "description": ("description", None),
+    "size": ("size_bytes", None),
+    "downloads": ("downloads", None),
+    "created_at": ("created_at", str),
+    "updated_at": ("updated_at", str),
+}
+
+
+def file_columns(fields=FILE_FIELDS) -> list:
+    """ Model fields (columns) of serialized file fields """
+    return [FILE_FIELDS[name][0] for name in fields]
+
+
+def serialize_rows(rows, fields=FILE_FIELDS):
+    """
+        Serialize files (as StoredFile.serialize) straight from rows of values_list(*file_columns(fields)),
+        model instances aren't built. Rows may have extra columns after the fields ones
+    """
+
+    names = list(fields)
+    converters = [(i, FILE_FIELDS[name][1]) for i, name in enumerate(names) if FILE_FIELDS[name][1]]
+    for row in rows:
+        if converters:
+            row = list(row)
+            for i, convert in converters:
+                row[i] = convert(row[i])
+        yield dict(zip(names, row))
+
+
+class Blob(models.Model):
+    """ Content-addressed file content, stored once and shared by stored files with equal content """
+
+    sha256 = models.CharField("SHA-256", max_length=64, unique=True)
+    file = models.FileField("File", upload_to=blob_path, max_length=256)
+    size_bytes = models.BigIntegerField("Size", default=0)
+    disk_bytes = models.BigIntegerField("Size on disk", default=0)
+    compressed = models.BooleanField("Compressed", default=False)
+    refs = models.IntegerField("References", default=0)
+    created_at = models.DateTimeField("Created at", auto_now_add=True, null=True)
+
+    class Meta:
+        verbose_name = "Blob"
+        verbose_name_plural = "Blobs"
+        ordering = ["pk"]
+
+    def __str__(self):
+        return self.sha256
+
+    @classmethod
+    def store(cls, content, sha256: str, size=None, compressed=False) -> "Blob":
+        """
+            Take reference to the blob with given content, blob is created if it doesn't exist yet
+            size: size of content (if stored content is compressed)
+        """
+
+        while True:
+            with transaction.atomic():
+                if cls.objects.filter(sha256=sha256).update(refs=models.F("refs") + 1):
+                    return cls.objects.get(sha256=sha256)
+
+            blob = cls(
+                sha256=sha256, size_bytes=content.size if size is None else size, disk_bytes=content.size,
+                compressed=compressed, refs=1)
+            blob.file.save(sha256, content, save=False)
+            try:
+                with transaction.atomic():
+                    blob.save()
+                return blob
+            except IntegrityError:
+                # Same content was stored concurrently - drop our copy and take reference to that blob
+                blob.file.delete(save=False)
+
+    def release(self):
+        """ Drop reference to the blob, blob without references is deleted with its file """
+
+        Blob.objects.filter(pk=self.pk).update(refs=models.F("refs") - 1)
+        deleted, _ = Blob.objects.filter(pk=self.pk, refs__lte=0).delete()
+        if deleted:
+            transaction.on_commit(lambda: self.file.delete(save=False))
+
+    @classmethod
+    def release_all(cls, refs: Counter) -> list:
+        """
+            Drop references to blobs at once ({blob pk: number of references}), one update per distinct number
+            returns: names of files of blobs without references (blobs are deleted, files are to be deleted)
+        """
+
+        for count in set(refs.values()):
+            pks = [pk for pk, n in refs.items() if n == count]
+            cls.objects.filter(pk__in=pks).update(refs=models.F("refs") - count)
+        orphans = cls.objects.filter(pk__in=refs, refs__lte=0)
+        names = list(orphans.values_list("file", flat=True))
+        orphans.delete()
+        return names
+
+
 class StoredFile(models.Model):
     """ Files in storage """
 
     file = models.FileField("File", upload_to=owner_file_path, max_length=256)
     name = models.CharField("Name", max_length=512, default="", null=False)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="files", verbose_name="Owner")
+    size_bytes = models.BigIntegerField("Size", default=0)
+    disk_bytes = models.BigIntegerField("Size on disk", default=0)
+    compressed = models.BooleanField("Compressed", default=False)
+    blob = models.ForeignKey(
+        Blob, on_delete=models.PROTECT, related_name="files", verbose_name="Blob", null=True, blank=True)
+    sha256 = models.CharField("SHA-256", max_length=64, blank=True, default="")
     description = models.CharField("Description", max_length=512, default="")
     downloads = models.IntegerField("Downloads", default=0)
     created_at = models.DateTimeField("Created at", auto_now_add=True, null=True)
     updated_at = models.DateTimeField("Updated at", auto_now=True, null=True)
+    # Time of last counted download, download counter isn't reflected in updated_at
+    downloaded_at = models.DateTimeField("Downloaded at", null=True, editable=False)
 
     class Meta:
         verbose_name = "Stored File"
         verbose_name_plural = "Stored Files"
         ordering = ["name"]
+        indexes = [models.Index(fields=["owner", "name", "id"], name="storedfile_owner_name_id")]
 
     @property
     def dir(self):
-        return self.file.name.split("/")[0]
+        return self.file.name.rsplit("/", 1)[0]
 
     @property
     def exists(self):
-        return os.path.exists(self.file.path)
-
-    @property
-    def size(self):
-        return self.file.size if self.exists else -1
+        return self.file.storage.exists(self.file.name)
 
     def __str__(self):
         return self.name
 
+    @property
+    def last_modified(self):
+        return int(self.updated_at.timestamp()) if self.updated_at else None
+
+    @property
+    def etag(self) -> str:
+        """ Strong validator of file content: content hash or (id, size, updated_at) """
+        if self.sha256:
+            return f'"{self.sha256}"'
+        stamp = int(self.updated_at.timestamp() * 1000000) if self.updated_at else 0
+        return f'"{self.pk:x}-{self.size_bytes:x}-{stamp:x}"'
+
+    @property
+    def info_modified(self):
+        """ Last-Modified of file info (serializer): file is changed or its download is counted """
+        return max((int(dt.timestamp()) for dt in (self.updated_at, self.downloaded_at) if dt), default=None)
+
+    @property
+    def info_etag(self) -> str:
+        """ Validator of file info (serializer), download counter isn't reflected in updated_at """
+        stamp = int(self.updated_at.timestamp() * 1000000) if self.updated_at else 0
+        return f'"i{self.pk:x}-{stamp:x}-{self.downloads:x}"'
+
     @property
     def serializer(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "description": self.description,
-            "size": self.size,
-            "downloads": self.downloads,
-            "created_at": str(self.created_at),
-            "updated_at": str(self.updated_at),
-        }
+        return self.serialize()
+
+    def serialize(self, fields=FILE_FIELDS) -> dict:
+        """ Serialize only given fields (see FILE_FIELDS), deferred columns are not touched """
+        data = {}
+        for name in fields:
+            attr, convert = FILE_FIELDS[name]
+            value = getattr(self, attr)
+            data[name] = convert(value) if convert else value
+        return data
+
+    @classmethod
+    def upload(cls, owner, name, content, description="", force=False, sha256=None):
+        """
+            Save uploaded content as owner's file, existing file with the same name is overwritten if force
+            returns: (stored file, created, error message)
+        """
+
+        if not valid_filename(name):
+            return None, False, f"Invalid filename - '{name}'"
+
+        exist = owner.files.filter(name=name).select_related("blob").first()
+        if exist and not force:
+            return None, False, f"File '{name}' already exists!"
+        files, size = 0 if exist else 1, content.size - (exist.size_bytes if exist else 0)
+        err = owner.quota_error(files, size)
+        if err:
+            return None, False, err
+
+        # Content is compressed and put into storage before owner's row is locked (it takes time for big files),
+        # replacing content is put aside to be renamed in place of the current one
+        new = cls(name=name, owner=owner, description=description)
+        new.set_content(content, sha256, commit=True, pending=bool(exist))
+
+        with transaction.atomic():
+            # Owner's row is locked, so concurrent uploads are checked against quota one by one
+            owner = User.objects.select_for_update().get(pk=owner.pk)
+            err = owner.quota_error(files, size)
+            if err:
+                new.release_content()
+            elif exist:
+                exist.forget_links()
+                Link.objects.filter(to_file=exist).delete()
+                owner.add_usage(0, size)
+                exist.replace_content(new)
+                exist.description = description or exist.description
+                exist.downloads = 0
+                exist.save()
+                new = exist
+            else:
+                new.save()
+                owner.add_usage(1, size)
+        if err:
+            return None, False, err
+
+        new.compress_content()
+        return new, not exist, ""
+
+    def set_content(self, content, sha256=None, commit=False, pending=False):
+        """
+            Attach uploaded content to the file (saved with the file row or at once if commit)
+            In STORAGE_DEDUP mode content is stored as shared blob, sha256 of content is required
+            In STORAGE_COMPRESSION mode compressible content is stored compressed
+            pending: own file is saved at once under temp name (UPLOAD_DIR), see replace_content
+        """
+
+        packed = pack(content) if STORAGE_COMPRESSION else None
+        try:
+            if STORAGE_DEDUP and sha256:
+                self.blob = Blob.store(packed or content, sha256, content.size, bool(packed))
+                self.file = self.blob.file.name
+                self.disk_bytes, self.compressed = self.blob.disk_bytes, self.blob.compressed
+            else:
+                self.blob = None
+                if pending:
+                    self.file = self.file.storage.save(f"{UPLOAD_DIR}/{uuid.uuid4().hex}", packed or content)
+                elif packed or commit:
+                    self.file.save(content.name, packed or content, save=False)
+                else:
+                    self.file = content
+                self.disk_bytes, self.compressed = (packed or content).size, bool(packed)
+        finally:
+            # Compressed temp file is moved into storage or not needed
+            if packed:
+                packed.close()
+                if os.path.exists(packed.path):
+                    os.remove(packed.path)
+        self.size_bytes = content.size
+        self.sha256 = sha256 or ""
+
+    def replace_content(self, new):
+        """
+            Take content stored for new (unsaved) file, previous content is released
+            Own file of new content is renamed in place of own file of previous one, so the file keeps its name
+        """
+
+        old_blob, old_name, old_sha256 = self.blob, self.file.name, self.sha256
+        if not old_blob and not new.blob_id:
+            new.file.storage.move(new.file.name, old_name)
+            new.file = old_name
+        self.file = new.file.name
+        for field in CONTENT_FIELDS:
+            setattr(self, field, getattr(new, field))
+
+        if old_blob:
+            # Row has to point to new content before unreferenced blob can be deleted (blob is protected)
+            StoredFile.objects.filter(pk=self.pk).update(blob=self.blob)
+            old_blob.release()
+        elif old_name != self.file.name:
+            delete_on_commit(self.file.storage, old_name)
+        if old_sha256 != self.sha256:
+            self.release_sidecars(old_sha256)
+
+    def remove(self) -> bool:
+        """
+            Delete the file with its links, content and usage
+            returns: False if the row was deleted meanwhile (content and usage are released once)
+        """
+
+        self.forget_links()
+        with transaction.atomic():
+            # Owner's row is locked first (as by uploads), then the file's row is read again under lock
+            owner = User.objects.select_for_update().get(pk=self.owner_id)
+            file = StoredFile.objects.select_for_update().filter(pk=self.pk).select_related("blob").first()
+            if not file:
+                return False
+            owner.add_usage(-1, -file.size_bytes)
+            file.delete()
+            file.release_content()
+        return True
+
+    def release_content(self):
+        """ Release content of deleted file: drop blob reference or delete own file after commit """
+
+        if self.blob_id:
+            self.blob.release()
+        else:
+            delete_on_commit(self.file.storage, self.file.name)
+        self.release_sidecars(self.sha256)
+
+    @classmethod
+    def delete_all(cls, files: list) -> set:
+        """
+            Delete files at once (set-based version of remove):
+            rows and links are deleted by one query, usage and blob references are changed by one update
+            per owner/blob, own files are deleted from storage after commit by pool of threads
+            Rows are read again under lock, files deleted meanwhile are skipped (released once)
+            returns: pks of deleted files
+        """
+
+        forget_links(Link.objects.filter(to_file__in=files).values_list("href", flat=True))
+        with transaction.atomic():
+            # Owners' rows are locked first (as by uploads), then the files' rows
+            owners = {u.pk: u for u in User.objects.select_for_update().filter(
+                pk__in={f.owner_id for f in files}).order_by("pk")}
+            files = list(cls.objects.select_for_update().filter(pk__in=[f.pk for f in files]))
+            usage = Counter()
+            for f in files:
+                usage[f.owner_id, "files"] += 1
+                usage[f.owner_id, "size"] += f.size_bytes
+            for pk in {f.owner_id for f in files}:
+                owners[pk].add_usage(-usage[pk, "files"], -usage[pk, "size"])
+            cls.objects.filter(pk__in=[f.pk for f in files]).delete()
+
+            own = [f for f in files if not f.blob_id]
+            names = [f.file.name for f in own] + Blob.release_all(Counter(f.blob_id for f in files if f.blob_id))
+            dirs = {f.dir for f in own} if STORAGE_FANOUT else ()
+            if names:
+                storage = cls.file.field.storage
+                transaction.on_commit(lambda: delete_files(storage, names, dirs))
+            cls.release_sidecars(*(f.sha256 for f in files))
+        return {f.pk for f in files}
+
+    def compress_content(self):
+        """ Build precompressed copies of content after commit (DOWNLOAD_COMPRESS_SIDECARS) """
+        if DOWNLOAD_COMPRESS_SIDECARS and self.sha256:
+            transaction.on_commit(lambda: build_sidecars(
+                self.file.name, self.name, self.sha256, self.size_bytes, self.compressed))
+
+    @staticmethod
+    def release_sidecars(*hashes: str):
+        """ Remove precompressed copies of contents after commit if no file has the same content """
+
+        hashes = {sha256 for sha256 in hashes if sha256}
+        if not DOWNLOAD_COMPRESS_SIDECARS or not hashes:
+            return
+
+        def remove():
+            used = set(StoredFile.objects.filter(sha256__in=hashes).values_list("sha256", flat=True))
+            [remove_sidecars(sha256) for sha256 in hashes - used]
+
+        transaction.on_commit(remove)
+
+    def forget_links(self):
+        """ Drop cached resolutions of file's links (call when file is changed or deleted) """
+        forget_links(self.links.values_list("href", flat=True))
 
     def rename(self, new_name="") -> str:
 
@@ -71,25 +437,40 @@ class StoredFile(models.Model):
         if self.owner.files.filter(name=new_name).exists():
             return f"File '{new_name}' already exists"
 
-        if os.path.exists(self.file.path):
-            new_path = os.path.join(STORAGE_DIR, self.dir, new_name)
-            if os.path.exists(new_path):
-                os.remove(new_path)
-            os.rename(self.file.path, new_path)
+        # Content of blob-backed file is addressed by hash, so rename touches only metadata
+        if self.blob_id:
+            self.name = new_name
+            self.save(update_fields=["name", "updated_at"])
+            self.forget_links()
+            return ""
+
+        # File is moved to path of new name (its fan-out dirs depend on the name)
+        old_file, new_file = self.file.name, file_path(self.owner.uuid, new_name)
+        if self.exists:
+            self.file.storage.move(old_file, new_file)
 
-        self.file.name = f"{self.dir}/{new_name}"
+        self.file.name = new_file
         self.name = new_name
-        self.save()
+        self.save(update_fields=["file", "name", "updated_at"])
+        self.forget_links()
+        if STORAGE_FANOUT:
+            self.file.storage.remove_dir(old_file.rsplit("/", 1)[0])
         return ""
 
 
 class Link(models.Model):
-    """ Links for downloading files """
+    """ Links for downloading files: link to one file or to archive (bundle) of owner's files """
 
-    to_file = models.ForeignKey(StoredFile, on_delete=models.CASCADE, related_name="links", verbose_name="To file")
+    to_file = models.ForeignKey(
+        StoredFile, on_delete=models.CASCADE, related_name="links", verbose_name="To file", null=True, blank=True)
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="bundle_links", verbose_name="Owner", null=True, blank=True)
+    files = models.ManyToManyField(StoredFile, related_name="bundle_links", verbose_name="Files", blank=True)
+    all_files = models.BooleanField("All files of owner", default=False)
+    archive = models.CharField("Archive format", max_length=3, blank=True, default="")
     href = models.CharField("Href", max_length=16, default=generate_href, unique=True, editable=False)
     created_at = models.DateTimeField("Created at", auto_now_add=True, null=True)
-    expire_at = models.DateTimeField("Expire at", null=True)
+    expire_at = models.DateTimeField("Expire at", null=True, db_index=True)
 
     class Meta:
         verbose_name = "Link"
@@ -99,15 +480,184 @@ class Link(models.Model):
     def __str__(self):
         return f"{BASE_URL}storage/get/?link={self.href}"
 
+    @classmethod
+    def resolve(cls, href: str):
+        """
+            Get data of linked file (see cache_data) from cache or DB
+            returns: None if link doesn't exist
+        """
+
+        if not HREF_RE.match(href) or (miss_cache and miss_cache.get(href)):
+            return None
+
+        data = link_cache.get(href) if link_cache else None
+        if data is None:
+            link = cls.objects.select_related("to_file__owner", "owner").filter(href=href).first()
+            if not link:
+                if miss_cache:
+                    miss_cache.set(href, True, LINK_MISS_TTL)
+                return None
+            data = link.cache_data
+            if link_cache:
+                ttl = LINK_CACHE_TTL
+                if link.expire_at:
+                    ttl = min(ttl, (link.expire_at - datetime.now(timezone.utc)).total_seconds())
+                if ttl > 0:
+                    link_cache.set(href, data, ttl)
+        return data
+
+    @property
+    def cache_data(self) -> dict:
+        """ All data needed to serve download via link """
+        if self.archive:
+            # Files of bundle are fetched on download, so the data isn't changed with them
+            return {
+                "bundle": self.pk,
+                "all_files": self.all_files,
+                "name": self.archive_name,
+                "format": self.archive,
+                "owner_id": self.owner_id,
+                "owner": str(self.owner),
+                "expire_at": self.expire_at,
+            }
+        file = self.to_file
+        return {
+            "file_id": file.pk,
+            "path": file.file.name,
+            "name": file.name,
+            "size": file.size_bytes,
+            "updated_at": file.updated_at,
+            "sha256": file.sha256,
+            "compressed": file.compressed,
+            "owner": str(file.owner),
+            "expire_at": self.expire_at,
+        }
+
+    @classmethod
+    def expired_links(cls):
+        return cls.objects.filter(expire_at__lt=datetime.now(timezone.utc))
+
     @property
     def expired(self):
         return self.expire_at and self.expire_at < datetime.now(timezone.utc)
 
+    @property
+    def archive_name(self) -> str:
+        return f"files.{self.archive}"
+
+    @staticmethod
+    def bundle_files(data: dict):
+        """ Files of bundle link by its data (see cache_data) """
+        files = StoredFile.objects.filter(owner_id=data["owner_id"])
+        return files if data["all_files"] else files.filter(bundle_links=data["bundle"])
+
     @property
     def serializer(self):
+        if self.archive:
+            name = self.archive_name
+            size = self.bundle_files(self.cache_data).aggregate(size=models.Sum("size_bytes"))["size"] or 0
+        else:
+            name, size = self.to_file.name, self.to_file.size_bytes
         return {
             "href": str(self),
-            "file_name": self.to_file.name,
-            "file_size": self.to_file.file.size,
+            "file_name": name,
+            "file_size": size,
             "expire_at": str(self.expire_at) if self.expire_at else "",
         }
+
+
+class UploadSession(models.Model):
+    """ Resumable upload: file is received by chunks into preallocated part file """
+
+    id = models.UUIDField("ID", primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="uploads", verbose_name="Owner")
+    name = models.CharField("Name", max_length=512)
+    description = models.CharField("Description", max_length=512, default="")
+    size_bytes = models.BigIntegerField("Size")
+    sha256 = models.CharField("SHA-256", max_length=64)
+    force = models.BooleanField("Force", default=False)
+    received = models.JSONField("Received ranges", default=list)
+    created_at = models.DateTimeField("Created at", auto_now_add=True, null=True)
+    updated_at = models.DateTimeField("Updated at", auto_now=True, null=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Upload Session"
+        verbose_name_plural = "Upload Sessions"
+        ordering = ["created_at"]
+
+    def __str__(self):
+        return f"{self.owner}/{self.name}"
+
+    @property
+    def path(self):
+        return os.path.join(upload_dir(), f"{self.id}.part")
+
+    @property
+    def complete(self):
+        return self.received == [[0, self.size_bytes]] or self.size_bytes == 0
+
+    @classmethod
+    def expired_sessions(cls):
+        return cls.objects.filter(updated_at__lt=datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_SESSION_TTL))
+
+    @property
+    def expired(self):
+        return self.updated_at < datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_SESSION_TTL)
+
+    @classmethod
+    def purge(cls, sessions) -> int:
+        """ Abort expired sessions of queryset, returns number of deleted sessions """
+        expired = list(sessions & cls.expired_sessions())
+        [session.abort() for session in expired]
+        return len(expired)
+
+    @staticmethod
+    def reserved(owner):
+        """
+            Usage reserved by owner's open sessions (part files are allocated at full size)
+            returns: (number of new files, size in bytes)
+        """
+        sessions = owner.uploads.all()
+        size = sessions.aggregate(size=models.Sum("size_bytes"))["size"] or 0
+        return sessions.exclude(name__in=owner.files.values("name")).count(), size
+
+    @property
+    def serializer(self):
+        return {
+            "id": str(self.id),
+            "name": self.name,
+            "size": self.size_bytes,
+            "received": self.received,
+            "complete": self.complete,
+            "created_at": str(self.created_at),
+            "expire_at": str(self.updated_at + timedelta(seconds=UPLOAD_SESSION_TTL)),
+        }
+
+    def allocate(self):
+        """ Create part file of full size, so chunks are written in place """
+        with open(self.path, "wb") as f:
+            if self.size_bytes and hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(f.fileno(), 0, self.size_bytes)
+            else:
+                f.truncate(self.size_bytes)
+
+    def add_range(self, start: int, end: int):
+        """ Merge received range [start, end) into session under row lock (chunks may come in parallel) """
+
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=self.pk)
+            ranges = []
+            for s, e in sorted(session.received + [[start, end]]):
+                if ranges and s <= ranges[-1][1]:
+                    ranges[-1][1] = max(ranges[-1][1], e)
+                else:
+                    ranges.append([s, e])
+            session.received = ranges
+            session.save(update_fields=["received", "updated_at"])
+        self.received = ranges
+
+    def abort(self):
+        """ Delete session and its part file """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.delete()
@@ -0,0 +1,59 @@
+import logging
+import threading
+import time
+
+from back.settings import RATE_LIMIT_STORE, RATE_LIMIT_RATE, RATE_LIMIT_BURST, RATE_LIMIT_IP_HEADER
+from storage.cache import make_cache
+
+
+class TokenBucket:
+    """
+        Per-key token bucket: up to `capacity` tokens, refilled by `rate` tokens per second
+        State is kept in pluggable store (see storage.cache.make_cache)
+    """
+
+    def __init__(self, store, rate=RATE_LIMIT_RATE, capacity=RATE_LIMIT_BURST):
+        self.store = store
+        self.rate = rate
+        self.capacity = capacity
+        self.lock = threading.Lock()
+
+    def tokens(self, key) -> float:
+        state = self.store.get(key)
+        if state is None:
+            return self.capacity
+        tokens, stamp = state
+        return min(self.capacity, tokens + (time.time() - stamp) * self.rate)
+
+    def allowed(self, key) -> bool:
+        return self.tokens(key) >= 1
+
+    def consume(self, key) -> bool:
+        """ Take one token, returns False if bucket is empty """
+        with self.lock:
+            tokens = self.tokens(key)
+            if tokens < 1:
+                return False
+            # Full bucket is equal to no state, so state expires when bucket is refilled
+            self.store.set(key, (tokens - 1, time.time()), self.capacity / self.rate)
+            return True
+
+
+def client_ip(request) -> str:
+    if RATE_LIMIT_IP_HEADER and request.META.get(RATE_LIMIT_IP_HEADER):
+        return request.META[RATE_LIMIT_IP_HEADER].split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+class RejectedFilter(logging.Filter):
+    """ Drop django.request warnings of rate limited requests (the limit hit is logged once by view) """
+
+    def filter(self, record) -> bool:
+        return getattr(record, "status_code", None) != 429
+
+
+# Invalid link lookups per client IP (only if it's configured where client IP is taken from)
+link_limiter = None
+if RATE_LIMIT_RATE and RATE_LIMIT_IP_HEADER:
+    link_limiter = TokenBucket(make_cache(RATE_LIMIT_STORE, "rate-link:", max_size=100000))
+logging.getLogger("django.request").addFilter(RejectedFilter())
@@ -0,0 +1,116 @@
+"""
+    S3-compatible object storage (AWS S3, MinIO, Ceph...), needs django-storages[s3] package
+    Settings: see AWS_* and S3_* in back/settings.py
+"""
+import io
+import os
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from django.core.files import File
+from storages.backends import s3
+from storages.utils import clean_name
+
+from back.settings import S3_MULTIPART_THRESHOLD, S3_MULTIPART_CHUNK_SIZE, S3_URL_EXPIRE
+
+
+class RangeFile(io.RawIOBase):
+    """
+        Read-only seekable object, data is read by ranged GET requests:
+        one streaming GET from current position is kept open until the next seek
+    """
+
+    def __init__(self, obj, size: int):
+        super().__init__()
+        self.obj = obj
+        self.size = size
+        self.pos = 0
+        self.body = None
+        self.body_pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def read(self, size=-1):
+        if self.pos >= self.size or size == 0:
+            return b""
+        if self.body is None or self.body_pos != self.pos:
+            self.close_body()
+            self.body = self.obj.get(Range=f"bytes={self.pos}-")["Body"]
+            self.body_pos = self.pos
+        data = self.body.read(size if size > 0 else None)
+        self.pos += len(data)
+        self.body_pos = self.pos
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def close_body(self):
+        if self.body is not None:
+            self.body.close()
+            self.body = None
+
+    def close(self):
+        self.close_body()
+        super().close()
+
+
+class S3Storage(s3.S3Storage):
+    """
+        Files in S3 bucket: big files are uploaded and copied by parts (multipart upload),
+        downloads read byte ranges or are redirected to presigned URL
+    """
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD, multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+            use_threads=self.use_threads)
+
+    def key(self, name: str) -> str:
+        return self._normalize_name(clean_name(name))
+
+    def _open(self, name, mode="rb"):
+        if mode != "rb":
+            return super()._open(name, mode)
+        obj = self.bucket.Object(self.key(name))
+        try:
+            size = obj.content_length
+        except ClientError as e:
+            if e.response["ResponseMetadata"]["HTTPStatusCode"] == 404:
+                raise FileNotFoundError(f"File does not exist: {name}")
+            raise
+        return File(RangeFile(obj, size), name)
+
+    def copy(self, old_name: str, new_name: str):
+        """ Copy stored file to new name (server-side copy, by parts for big files) """
+        source = {"Bucket": self.bucket_name, "Key": self.key(old_name)}
+        self.bucket.Object(self.key(new_name)).copy(source, Config=self.transfer_config)
+
+    def move(self, old_name: str, new_name: str):
+        self.copy(old_name, new_name)
+        self.delete(old_name)
+
+    def remove_dir(self, name: str):
+        """ Object storage has no directories """
+
+    def download_url(self, name: str, filename: str):
+        """ Presigned URL for downloading file directly from storage """
+        return self.url(
+            name, parameters={"ResponseContentDisposition": f"attachment; filename='{filename}'"},
+            expire=S3_URL_EXPIRE)
@@ -1,3 +1,806 @@
-from django.test import TestCase
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from datetime import datetime, timedelta, timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+
+from back.settings import OK_200, ERROR_BAD_BULK, ERROR_BAD_CURSOR, ERROR_BAD_CHUNK, ERROR_SESSION_404
+from back.settings import UPLOAD_DIR, UPLOAD_SESSION_MAX_SIZE, UPLOAD_SESSION_MAX_COUNT
+from back.utils import encode_cursor, decode_cursor
+from storage.archive import ARCHIVE_COLUMNS, ArchiveChunks
+from storage.backends import LocalStorage
+from storage.counters import DownloadCounter
+from storage.compression import ENCODINGS, sidecar_path
+from storage.cache import LocalCache, SharedCache, is_shared, make_cache
+from storage.download import if_range_matches, parse_range
+from storage.frames import SeekTable, compress_frames, read_frames, zstandard
+from storage.models import Blob, Link, StoredFile, UploadSession, file_path
+from storage.ratelimit import TokenBucket
+from users.models import User
+
+try:
+    import boto3
+    from moto import mock_aws
+    from storage.s3 import S3Storage
+except ImportError:
+    mock_aws = None
+
+
+class StorageTestCase(TestCase):
+    """ Logged in client, stored files are written into temp dir """
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=self.storage_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.storage_dir, ignore_errors=True)
+        self.addCleanup(lambda: [session.abort() for session in UploadSession.objects.all()])
+
+        self.user = User.objects.create_user("alice", "", "Passw0rd!")
+        self.client.login(username="alice", password="Passw0rd!")
+
+    def upload(self, name, data, **params) -> dict:
+        return self.client.post("/storage/upload/", {"file": SimpleUploadedFile(name, data), **params}).json()
+
+
+class UploadQuotaTests(StorageTestCase):
+
+    def test_files_quota(self):
+        self.user.quota_files = 1
+        self.user.save()
+        self.assertEqual(self.upload("a.txt", b"a")["ok"], 201)
+
+        # Upload is stopped by quota handler before storage handler has opened its file
+        response = self.client.post("/storage/upload/", {"file": SimpleUploadedFile("b.txt", b"b")})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"error": 400, "error_msg": "Files quota exceeded (max 1 files)"})
+        self.assertEqual(list(self.user.files.values_list("name", flat=True)), ["a.txt"])
+
+    def test_size_quota(self):
+        self.user.quota_size = 10
+        self.user.save()
+        self.assertEqual(self.upload("a.txt", b"a" * 20)["error_msg"], "Storage quota exceeded (max 10 bytes)")
+        self.assertFalse(self.user.files.exists())
+
+
+@skipUnless(mock_aws, "moto and django-storages[s3] packages are not installed")
+class S3Tests(SimpleTestCase):
+
+    data = bytes(range(256)) * 40
+
+    def setUp(self):
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="files")
+        self.storage = S3Storage(bucket_name="files", region_name="us-east-1", access_key="key", secret_key="secret")
+        self.storage.save("u/a.bin", io.BytesIO(self.data))
+
+    def test_range_file(self):
+        with self.storage.open("u/a.bin") as f:
+            self.assertEqual((f.size, f.read(10)), (len(self.data), self.data[:10]))
+            self.assertEqual(f.read(5), self.data[10:15])
+            f.seek(5000)
+            self.assertEqual((f.read(3), f.tell()), (self.data[5000:5003], 5003))
+            f.seek(-4, os.SEEK_END)
+            self.assertEqual((f.read(), f.read()), (self.data[-4:], b""))
+            f.seek(-1000, os.SEEK_CUR)
+            self.assertEqual(f.read(), self.data[-1000:])
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open("u/none.bin")
+
+    def test_move(self):
+        self.storage.move("u/a.bin", "ab/cd/u/a.bin")
+        self.assertFalse(self.storage.exists("u/a.bin"))
+        with self.storage.open("ab/cd/u/a.bin") as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_download_url(self):
+        url = self.storage.download_url("u/a.bin", "a.bin")
+        self.assertIn("/u/a.bin?", url)
+        self.assertIn("response-content-disposition=attachment%3B%20filename%3D%27a.bin%27", url)
+        self.assertIn("Expires=", url)
+
+
+class AdminUploadTests(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        User.objects.create_superuser("admin", "", "Passw0rd!")
+        self.admin = Client()
+        self.admin.login(username="admin", password="Passw0rd!")
+
+    def test_add_file(self):
+        data = b"x" * 1400
+        self.admin.post("/admin/storage/storedfile/add/", {
+            "file": SimpleUploadedFile("a.bin", data), "name": "a.bin", "owner": self.user.pk,
+            "description": "-", "downloads": 0})
+        file = self.user.files.get()
+        self.assertEqual((file.size_bytes, file.disk_bytes), (1400, 1400))
+        self.assertEqual(file.sha256, hashlib.sha256(data).hexdigest())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.total_size, 1400)
+
+        response = self.client.get(f"/storage/file/{file.pk}/download/")
+        self.assertEqual(response["Content-Length"], "1400")
+        self.assertEqual(b"".join(response.streaming_content), data)
+
+    def test_replace_file(self):
+        file = self.user.files.get(pk=self.upload("a.bin", b"old")["file"]["id"])
+        self.admin.post(f"/admin/storage/storedfile/{file.pk}/change/", {
+            "file": SimpleUploadedFile("a.bin", b"new content"), "name": "a.bin", "owner": self.user.pk,
+            "description": "-", "downloads": 0})
+        file.refresh_from_db()
+        self.assertEqual(file.size_bytes, 11)
+        self.assertEqual(file.file.read(), b"new content")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.total_size, 11)
+
+
+class CursorTests(StorageTestCase):
+
+    def test_encode_decode(self):
+        self.assertEqual(decode_cursor(encode_cursor("a.txt", 5)), ["a.txt", 5])
+        self.assertIsNone(decode_cursor("not a cursor!"))
+        self.assertIsNone(decode_cursor(base64.urlsafe_b64encode(b'{"a": 1}').decode()))
+
+    def test_pages(self):
+        for name in ("c.txt", "a.txt", "b.txt"):
+            self.upload(name, b"x")
+        names, cursor = [], ""
+        while True:
+            page = self.client.get("/storage/", {"limit": 2, "cursor": cursor}).json()
+            names += [f["name"] for f in page["files"]]
+            cursor = page["next"]
+            if not cursor:
+                break
+        self.assertEqual(names, ["a.txt", "b.txt", "c.txt"])
+
+    def test_tampered_cursor(self):
+        self.upload("a.txt", b"x")
+        for values in (["a", "x"], ["a", None], ["a", True], [1, 2], ["a"], ["a", 1, 2], {"a": 1}):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            self.assertEqual(self.client.get("/storage/", {"cursor": cursor}).json(), ERROR_BAD_CURSOR, values)
+        self.assertEqual(self.client.get("/storage/", {"cursor": "%%%"}).json(), ERROR_BAD_CURSOR)
+
+
+class UploadSessionTests(StorageTestCase):
+
+    data = b"0123456789" * 100
+
+    def create(self, name="a.bin", data=data, **params) -> dict:
+        return self.client.post("/storage/upload/session/", {
+            "filename": name, "size": len(data), "sha256": hashlib.sha256(data).hexdigest(), **params,
+        }, content_type="application/json").json()
+
+    def put(self, session_id, offset: int, chunk: bytes) -> dict:
+        return self.client.put(f"/storage/upload/session/{session_id}/?offset={offset}", chunk,
+                               content_type="application/octet-stream").json()
+
+    def commit(self, session_id) -> dict:
+        return self.client.post(f"/storage/upload/session/{session_id}/commit/").json()
+
+    def test_upload(self):
+        session = self.create()["session"]
+        # Chunks come out of order, commit of incomplete upload is refused
+        self.assertEqual(self.put(session["id"], 500, self.data[500:])["session"]["received"], [[500, 1000]])
+        self.assertEqual(self.commit(session["id"])["error_msg"], "Upload is not complete")
+        session = self.put(session["id"], 0, self.data[:500])["session"]
+        self.assertEqual((session["received"], session["complete"]), ([[0, 1000]], True))
+
+        result = self.commit(session["id"])
+        self.assertEqual((result["ok"], result["file"]["size"]), (201, 1000))
+        self.assertEqual(self.user.files.get().file.read(), self.data)
+        self.assertFalse(self.user.uploads.exists())
+
+    def test_checksum_mismatch(self):
+        session = self.create()["session"]
+        self.put(session["id"], 0, b"x" * 1000)
+        result = self.commit(session["id"])
+        self.assertEqual((result["error_msg"], result["session"]["received"]), ("Checksum mismatch", []))
+
+    def test_chunk_out_of_file(self):
+        session = self.create()["session"]
+        self.assertEqual(self.put(session["id"], 900, b"x" * 200), ERROR_BAD_CHUNK)
+
+    def test_abort(self):
+        session = self.create()["session"]
+        path = self.user.uploads.get().path
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.client.delete(f"/storage/upload/session/{session['id']}/").json(), OK_200)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.commit(session["id"]), ERROR_SESSION_404)
+
+    def test_open_sessions_count_to_quota(self):
+        self.user.quota_size = 1500
+        self.user.save()
+        self.assertEqual(self.create("a.bin")["ok"], 201)
+        self.assertEqual(self.create("b.bin")["error_msg"], "Storage quota exceeded (max 1500 bytes)")
+
+    def test_limits(self):
+        result = self.client.post("/storage/upload/session/", {
+            "filename": "a.bin", "size": UPLOAD_SESSION_MAX_SIZE + 1, "sha256": "0" * 64,
+        }, content_type="application/json").json()
+        self.assertEqual(result["error_msg"], f"File is too large (max {UPLOAD_SESSION_MAX_SIZE} bytes)")
+
+        for i in range(UPLOAD_SESSION_MAX_COUNT):
+            self.assertEqual(self.create(f"{i}.bin")["ok"], 201)
+        self.assertEqual(self.create()["error_msg"], f"Too many unfinished uploads (max {UPLOAD_SESSION_MAX_COUNT})")
+
+    def test_expired(self):
+        session = self.create()["session"]
+        path = self.user.uploads.get().path
+        UploadSession.objects.update(updated_at=datetime.now(timezone.utc) - timedelta(days=2))
+        self.assertEqual(self.put(session["id"], 0, self.data), ERROR_SESSION_404)
+        self.assertFalse(os.path.exists(path))
+
+        self.create()
+        UploadSession.objects.update(updated_at=datetime.now(timezone.utc) - timedelta(days=2))
+        call_command("purge_uploads", stdout=io.StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+
+
+@skipUnless(zstandard, "zstandard package is not installed")
+class FramesTests(SimpleTestCase):
+
+    data = os.urandom(1000) * 50 + b"tail"
+
+    def packed(self, frame_size=4096):
+        f = io.BytesIO()
+        chunks = (self.data[i:i + frame_size] for i in range(0, len(self.data), frame_size))
+        self.assertTrue(compress_frames(chunks, f))
+        return f
+
+    def test_seek_table(self):
+        table = SeekTable(self.packed())
+        self.assertEqual(table.size, len(self.data))
+        self.assertEqual(table.positions[:3], [0, 4096, 8192])
+        self.assertEqual(len(table.offsets), len(self.data) // 4096 + 2)
+
+    def test_read_frames(self):
+        f = self.packed()
+        self.assertEqual(b"".join(read_frames(f)), self.data)
+        # Ranges inside one frame, across frame boundaries and up to the end
+        for offset, length in ((0, 10), (4090, 10), (4096, 4096), (100, 20000), (len(self.data) - 5, 100)):
+            self.assertEqual(b"".join(read_frames(f, offset, length)), self.data[offset:offset + length])
+
+    def test_incompressible(self):
+        self.assertFalse(compress_frames([os.urandom(4096)], io.BytesIO()))
+
+    def test_not_seekable(self):
+        with self.assertRaises(ValueError):
+            SeekTable(io.BytesIO(b"x" * 100))
+
+
+class OverwriteTests(StorageTestCase):
+
+    def test_overwrite_keeps_name(self):
+        first = self.upload("a.txt", b"one")["file"]
+        name = self.user.files.get().file.name
+        second = self.upload("a.txt", b"second", force=1)
+        self.assertEqual((second["ok"], second["file"]["id"]), (200, first["id"]))
+        file = self.user.files.get()
+        self.assertEqual((file.file.name, file.size_bytes, file.file.read()), (name, 6, b"second"))
+        self.assertEqual(os.listdir(os.path.join(self.storage_dir, UPLOAD_DIR)), [])
+
+
+class DownloadCounterTests(StorageTestCase):
+
+    def test_failed_flush_keeps_increments(self):
+        file_id = self.upload("a.txt", b"abc")["file"]["id"]
+        counter = DownloadCounter(flush_size=100)
+        counter.add(file_id)
+        counter.add(file_id)
+
+        with mock.patch("storage.counters.StoredFile.objects.filter", side_effect=OperationalError("gone")), \
+                mock.patch("storage.counters.close_old_connections") as close:
+            counter.flush()
+        close.assert_called_once()
+        self.assertEqual((counter.pending[file_id], counter.count), (2, 2))
+
+        counter.flush()
+        self.assertEqual(self.user.files.get().downloads, 2)
+        self.assertEqual(counter.count, 0)
+
+
+class LinkCacheTests(StorageTestCase):
+
+    def link(self, file_id) -> str:
+        link = self.client.post("/storage/file/link/", {"file_id": file_id}, content_type="application/json")
+        return link.json()["link"]["href"].split("=")[1]
+
+    def download(self, href) -> bytes:
+        return b"".join(Client().get("/storage/get/", {"link": href}))
+
+    def test_local_cache_off(self):
+        self.assertFalse(is_shared("django"))
+        self.assertIsNone(make_cache("", "link:"))
+
+    def test_changed_link_dropped(self):
+        cache = SharedCache("link:")
+        with mock.patch("storage.models.link_cache", cache), mock.patch("storage.cache.link_cache", cache):
+            file_id = self.upload("a.txt", b"one")["file"]["id"]
+            href = self.link(file_id)
+            self.assertEqual(self.download(href), b"one")
+            self.assertEqual(cache.get(href)["size"], 3)
+
+            # Overwritten file loses its links
+            self.upload("a.txt", b"second", force=1)
+            self.assertIsNone(cache.get(href))
+            self.assertEqual(self.download(href), b"<h1>Invalid Link!</h1>")
+
+            href = self.link(file_id)
+            self.assertEqual(self.download(href), b"second")
+            self.client.delete(f"/storage/file/{file_id}/")
+            self.assertIsNone(cache.get(href))
+            self.assertEqual(self.download(href), b"<h1>Invalid Link!</h1>")
+
+
+class PurgeLinksTests(StorageTestCase):
+
+    def test_purge(self):
+        ids = [self.upload(name, b"x")["file"]["id"] for name in ("a.txt", "b.txt")]
+        past = datetime.now(timezone.utc) - timedelta(minutes=1)
+        Link.objects.create(to_file_id=ids[0], expire_at=past)
+        Link.objects.create(owner=self.user, archive="zip", expire_at=past).files.set(ids)
+        live = Link.objects.create(to_file_id=ids[1])
+        out = io.StringIO()
+        call_command("purge_links", "--batch-size", "1", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Expired links deleted: 2")
+        self.assertEqual(list(Link.objects.all()), [live])
+
+
+class RelayoutTests(StorageTestCase):
+
+    def test_relayout(self):
+        for name in ("a.txt", "b.txt", "c.txt"):
+            self.upload(name, name.encode())
+        uuid = self.user.uuid
+        copy = LocalStorage.copy
+
+        def changed_meanwhile(storage, old, new):
+            # b.txt is overwritten after it's copied to new name, but before its row is switched
+            copy(storage, old, new)
+            StoredFile.objects.filter(name="b.txt").update(file=f"{uuid}/b.new")
+
+        out = io.StringIO()
+        with mock.patch.object(LocalStorage, "copy", changed_meanwhile):
+            call_command("relayout_files", "--fanout", "2", "--pause", "0", "--batch-size", "2", stdout=out)
+        self.assertIn("Moved files: 2, skipped (changed while moving): 1", out.getvalue())
+        files = {f.name: f.file.name for f in self.user.files.all()}
+        self.assertEqual(files, {
+            "a.txt": file_path(uuid, "a.txt", 2), "b.txt": f"{uuid}/b.new", "c.txt": file_path(uuid, "c.txt", 2)})
+        self.assertEqual(self.user.files.get(name="c.txt").file.read(), b"c.txt")
+        self.assertFalse(os.path.exists(os.path.join(self.storage_dir, file_path(uuid, "b.txt", 2))))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.storage_dir, str(uuid)))), ["b.txt"])
+
+        # Fan-out dirs emptied by moving files back are removed
+        call_command("relayout_files", "--fanout", "0", "--pause", "0", stdout=io.StringIO())
+        self.assertEqual(sorted(os.listdir(self.storage_dir)), [UPLOAD_DIR, str(uuid)])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.storage_dir, str(uuid)))), ["a.txt", "b.txt", "c.txt"])
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_consume_and_refill(self):
+        bucket = TokenBucket(LocalCache(), rate=0.5, capacity=2)
+        with mock.patch("storage.ratelimit.time.time", return_value=1000):
+            self.assertEqual([bucket.consume("ip") for _ in range(3)], [True, True, False])
+            self.assertFalse(bucket.allowed("ip"))
+            self.assertTrue(bucket.allowed("other"))
+        with mock.patch("storage.ratelimit.time.time", return_value=1001):
+            self.assertFalse(bucket.allowed("ip"))
+        with mock.patch("storage.ratelimit.time.time", return_value=1002):
+            self.assertTrue(bucket.consume("ip"))
+            self.assertFalse(bucket.consume("ip"))
+        with mock.patch("storage.ratelimit.time.time", return_value=2000):
+            self.assertEqual(bucket.tokens("ip"), 2)
+
+    def test_rejected_links_not_logged_by_django(self):
+        bucket = TokenBucket(LocalCache(), rate=0.001, capacity=1)
+        with mock.patch("storage.views.link_limiter", bucket), self.assertNoLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.get("/storage/get/", {"link": "x"}).status_code, 200)
+            self.assertEqual(self.client.get("/storage/get/", {"link": "x"}).status_code, 429)
+
+
+
+class RangeTests(SimpleTestCase):
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), [(0, 9)])
+        self.assertEqual(parse_range("bytes=90-", 100), [(90, 99)])
+        self.assertEqual(parse_range("bytes=-10", 100), [(90, 99)])
+        self.assertEqual(parse_range("bytes=-200", 100), [(0, 99)])
+        self.assertEqual(parse_range("bytes=50-500", 100), [(50, 99)])
+        self.assertEqual(parse_range("Bytes = 0-0 , 2-3", 100), [(0, 0), (2, 3)])
+
+    def test_ranges_are_sorted_and_merged(self):
+        self.assertEqual(parse_range("bytes=20-29,0-9,10-14,25-40", 100), [(0, 14), (20, 40)])
+        self.assertEqual(parse_range("bytes=0-9,11-19", 100), [(0, 9), (11, 19)])
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_range("bytes=100-", 100), [])
+        self.assertEqual(parse_range("bytes=-0", 100), [])
+        self.assertEqual(parse_range("bytes=0-", 0), [])
+
+    def test_invalid_is_ignored(self):
+        for header in ("bytes=", "items=0-1", "bytes=-", "bytes=a-b", "bytes=5-1", "bytes=0-1,x", "0-1"):
+            self.assertIsNone(parse_range(header, 100), header)
+
+    def test_if_range(self):
+        self.assertTrue(if_range_matches(' "abc" ', '"abc"', 0))
+        self.assertFalse(if_range_matches('"abd"', '"abc"', 0))
+        self.assertFalse(if_range_matches('W/"abc"', '"abc"', 0))
+        self.assertTrue(if_range_matches("Sun, 06 Nov 1994 08:49:37 GMT", '"abc"', 784111777))
+        self.assertFalse(if_range_matches("Sun, 06 Nov 1994 08:49:38 GMT", '"abc"', 784111777))
+        self.assertFalse(if_range_matches("not a date", '"abc"', 784111777))
+
+
+class RangeDownloadTests(StorageTestCase):
+
+    def download(self, file_id, **headers):
+        response = self.client.get(f"/storage/file/{file_id}/download/", **headers)
+        return response.status_code, b"".join(response.streaming_content) if response.streaming else b""
+
+    def test_range_download(self):
+        file_id = self.upload("a.bin", bytes(range(100)))["file"]["id"]
+        self.assertEqual(self.download(file_id, HTTP_RANGE="bytes=10-12"), (206, bytes([10, 11, 12])))
+        self.assertEqual(self.download(file_id, HTTP_RANGE="bytes=100-")[0], 416)
+        self.assertEqual(self.download(file_id, HTTP_RANGE="bytes=5-1"), (200, bytes(range(100))))
+
+        etag = self.client.get(f"/storage/file/{file_id}/download/", HTTP_RANGE="bytes=0-0")["ETag"]
+        self.assertEqual(self.download(file_id, HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE=etag), (206, bytes([0, 1])))
+        self.assertEqual(self.download(file_id, HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE='"other"')[0], 200)
+
+
+class CompressionTests(StorageTestCase):
+
+    text = b"hello world\n" * 200
+
+    def get(self, file_id, **headers):
+        return self.client.get(f"/storage/file/{file_id}/download/", **headers)
+
+    def test_negotiation(self):
+        file_id = self.upload("a.txt", self.text)["file"]["id"]
+        response = self.get(file_id, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual((response["Content-Encoding"], response["Content-Type"]), ("gzip", "application/octet-stream"))
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), self.text)
+
+        response = self.get(file_id, HTTP_ACCEPT_ENCODING="gzip;q=0, *;q=0.5")
+        self.assertEqual(response.get("Content-Encoding"), next((e for e in ENCODINGS if e != "gzip"), None))
+        identity = ({}, {"HTTP_ACCEPT_ENCODING": "identity"}, {"HTTP_ACCEPT_ENCODING": "gzip", "HTTP_RANGE": "bytes=0-4"})
+        for headers in identity:
+            response = self.get(file_id, **headers)
+            self.assertNotIn("Content-Encoding", response, headers)
+            self.assertEqual(response["Content-Type"], "application/octet-stream")
+        self.assertEqual(b"".join(response.streaming_content), b"hello")
+
+    def test_etag_vary(self):
+        file_id = self.upload("a.txt", self.text)["file"]["id"]
+        plain, packed = self.get(file_id), self.get(file_id, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertNotEqual(plain["ETag"], packed["ETag"])
+        self.assertIn("Accept-Encoding", plain["Vary"])
+        self.assertIn("Accept-Encoding", packed["Vary"])
+
+        response = self.get(file_id, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=packed["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(self.get(file_id, HTTP_IF_NONE_MATCH=packed["ETag"]).status_code, 200)
+
+    def test_threshold(self):
+        for name, data in (("small.txt", b"x" * 100), ("a.bin", self.text)):
+            response = self.get(self.upload(name, data)["file"]["id"], HTTP_ACCEPT_ENCODING="gzip")
+            self.assertNotIn("Content-Encoding", response, name)
+            self.assertNotIn("Accept-Encoding", response.get("Vary", ""), name)
+
+    @mock.patch("storage.models.DOWNLOAD_COMPRESS_SIDECARS", ["gzip"])
+    @mock.patch("storage.compression.DOWNLOAD_COMPRESS_SIDECARS", ["gzip"])
+    @mock.patch("storage.download.DOWNLOAD_COMPRESS_SIDECARS", ["gzip"])
+    def test_sidecars(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            file_id = self.upload("a.txt", self.text)["file"]["id"]
+        path = os.path.join(self.storage_dir, sidecar_path(hashlib.sha256(self.text).hexdigest(), "gzip"))
+        self.assertTrue(os.path.exists(path))
+
+        # Precompressed copy is sent with its length
+        response = self.get(file_id, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Length"], str(os.path.getsize(path)))
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), self.text)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/storage/file/{file_id}/")
+        self.assertFalse(os.path.exists(path))
+
+
+class BoolIdTests(StorageTestCase):
+    """ true is int in Python and would be taken as pk 1 """
+
+    def post(self, url, data) -> dict:
+        return self.client.post(url, data, content_type="application/json").json()
+
+    def test_bool_ids_rejected(self):
+        file_id = self.upload("a.txt", b"abc")["file"]["id"]
+        self.assertEqual(file_id, 1)
+        self.assertEqual(self.post("/storage/bulk/delete/", {"file_ids": [True]}), ERROR_BAD_BULK)
+        self.assertEqual(self.post("/storage/bulk/link/", {"file_ids": [1, True]}), ERROR_BAD_BULK)
+        self.assertEqual(self.post("/storage/archive/link/", {"file_ids": [True]})["error"], 400)
+        self.assertEqual(self.post("/storage/file/link/", {"file_id": True})["error"], 400)
+        self.assertEqual(self.post("/storage/upload/session/", {"filename": "b.txt", "size": True,
+                                                                 "sha256": "0" * 64})["error"], 400)
+        self.assertEqual(self.user.files.count(), 1)
+
+    def test_bool_duration_ignored(self):
+        file_id = self.upload("a.txt", b"abc")["file"]["id"]
+        link = self.post("/storage/file/link/", {"file_id": file_id, "duration": True})
+        self.assertEqual(link["link"]["expire_at"], "")
+
+
+class ExtractTests(StorageTestCase):
+
+    @staticmethod
+    def archive(entries) -> bytes:
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, content in entries:
+                archive.writestr(name, content)
+        return data.getvalue()
+
+    def extract(self, entries, **params) -> dict:
+        return self.upload("a.zip", self.archive(entries), extract=1, **params)
+
+    def test_quota_checked_before_extraction(self):
+        self.upload("a.txt", b"abc")
+        User.objects.filter(pk=self.user.pk).update(quota_files=2)
+        with mock.patch("storage.extract.spool") as spool:
+            result = self.extract([("b.txt", b"b"), ("c.txt", b"c")])
+        self.assertEqual(result["error"], 400)
+        spool.assert_not_called()
+        # Replacement of existing file doesn't take more of files quota
+        self.assertEqual(self.extract([("a.txt", b"new"), ("b.txt", b"b")], force=1)["ok"], 201)
+
+    def test_nothing_stored(self):
+        self.upload("a.txt", b"abc")
+        result = self.extract([("a.txt", b"new"), ("bad:name", b"x")])
+        self.assertEqual((result["error"], [r["error"] for r in result["results"]]), (400, [400, 400]))
+        self.assertEqual(self.user.files.get().file.read(), b"abc")
+
+    def test_force_keeps_name(self):
+        self.upload("a.txt", b"abc")
+        name = self.user.files.get().file.name
+        result = self.extract([("dir/a.txt", b"new content")], force=1)
+        self.assertEqual((result["ok"], result["results"][0]["ok"]), (200, 200))
+        file = self.user.files.get()
+        self.assertEqual((file.file.name, file.size_bytes, file.file.read()), (name, 11, b"new content"))
+        self.assertEqual(os.listdir(os.path.join(self.storage_dir, UPLOAD_DIR)), [])
+
+
+class InfoValidatorsTests(StorageTestCase):
+
+    def test_download_changes_last_modified(self):
+        file_id = self.upload("a.txt", b"abc")["file"]["id"]
+        StoredFile.objects.filter(pk=file_id).update(updated_at=datetime.now(timezone.utc) - timedelta(days=1))
+        User.objects.filter(pk=self.user.pk).update(updated_at=datetime.now(timezone.utc) - timedelta(days=1))
+        urls = (f"/storage/file/{file_id}/", "/storage/")
+        before = [self.client.get(url) for url in urls]
+
+        b"".join(self.client.get(f"/storage/file/{file_id}/download/").streaming_content)
+        for url, response in zip(urls, before):
+            after = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(after.status_code, 200, url)
+            self.assertNotEqual(after["ETag"], response["ETag"], url)
+            self.assertNotEqual(after["Last-Modified"], response["Last-Modified"], url)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=after["Last-Modified"]).status_code, 304)
+
+
+class DeleteTests(StorageTestCase):
+
+    def usage(self):
+        self.user.refresh_from_db()
+        return self.user.files_count, self.user.total_size
+
+    def test_delete_twice(self):
+        file_id = self.upload("a.txt", b"abc")["file"]["id"]
+        self.assertEqual(self.client.delete(f"/storage/file/{file_id}/").json(), OK_200)
+        self.assertEqual(self.client.delete(f"/storage/file/{file_id}/").json()["error"], 404)
+        self.assertEqual(self.usage(), (0, 0))
+
+    @mock.patch("storage.models.STORAGE_DEDUP", True)
+    def test_stale_file_released_once(self):
+        # Both requests have read the row before either of them deleted it
+        file_id = self.upload("a.txt", b"abc")["file"]["id"]
+        self.upload("b.txt", b"abc")
+        first, second = StoredFile.objects.get(pk=file_id), StoredFile.objects.get(pk=file_id)
+        self.assertTrue(first.remove())
+        self.assertFalse(second.remove())
+        self.assertEqual(self.usage(), (1, 3))
+        self.assertEqual(Blob.objects.get().refs, 1)
+        self.assertEqual(self.client.delete(f"/storage/file/{file_id + 1}/").json(), OK_200)
+        self.assertEqual((self.usage(), Blob.objects.count()), ((0, 0), 0))
+
+
+@mock.patch("storage.models.STORAGE_DEDUP", True)
+class DedupTests(StorageTestCase):
+
+    def blob_path(self, blob) -> str:
+        return os.path.join(self.storage_dir, blob.file.name)
+
+    def test_equal_uploads_share_blob(self):
+        self.upload("a.txt", b"abc")
+        self.upload("b.txt", b"abc")
+        blob = Blob.objects.get()
+        self.assertEqual((blob.refs, blob.size_bytes), (2, 3))
+        self.assertEqual(set(self.user.files.values_list("file", flat=True)), {blob.file.name})
+        self.assertTrue(os.path.exists(self.blob_path(blob)))
+
+    def test_overwrite_releases_blob(self):
+        self.upload("a.txt", b"abc")
+        self.upload("b.txt", b"abc")
+        old = Blob.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload("a.txt", b"new", force=1)
+        self.assertEqual(Blob.objects.get(pk=old.pk).refs, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload("b.txt", b"new", force=1)
+        self.assertEqual(list(Blob.objects.values_list("refs", flat=True)), [2])
+        self.assertFalse(os.path.exists(self.blob_path(old)))
+
+    def test_delete_removes_orphan(self):
+        first = self.upload("a.txt", b"abc")["file"]["id"]
+        second = self.upload("b.txt", b"abc")["file"]["id"]
+        blob = Blob.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/storage/file/{first}/")
+        self.assertEqual(Blob.objects.get().refs, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/storage/file/{second}/")
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(self.blob_path(blob)))
+
+    def test_gc_blobs(self):
+        self.upload("a.txt", b"abc")
+        self.upload("b.txt", b"xyz")
+        used, orphan = Blob.objects.all()
+        Blob.objects.filter(pk=used.pk).update(refs=5, created_at=datetime.now(timezone.utc) - timedelta(days=1))
+        StoredFile.objects.filter(blob=orphan).update(blob=None)
+        # Drifted counter is fixed, new blob (its upload may be in progress) is kept until it's old enough
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("gc_blobs", stdout=io.StringIO())
+        self.assertEqual(list(Blob.objects.values_list("refs", flat=True)), [1, 1])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("gc_blobs", "--min-age", "0", stdout=io.StringIO())
+        self.assertEqual(list(Blob.objects.values_list("pk", flat=True)), [used.pk])
+        self.assertFalse(os.path.exists(self.blob_path(orphan)))
+        self.assertTrue(os.path.exists(self.blob_path(used)))
+
+
+class BulkTests(StorageTestCase):
+
+    def post(self, url, data) -> dict:
+        return self.client.post(url, data, content_type="application/json").json()
+
+    def usage(self):
+        self.user.refresh_from_db()
+        return self.user.files_count, self.user.total_size
+
+    def test_delete(self):
+        ids = [self.upload(name, b"x" * n)["file"]["id"] for n, name in enumerate(("a.txt", "b.txt", "c.txt"), 1)]
+        paths = [f.file.path for f in self.user.files.order_by("pk")]
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.post("/storage/bulk/delete/", {"file_ids": [ids[0], 999, ids[2], ids[0]]})
+        self.assertEqual(
+            [(r["id"], r.get("ok") or r["error"]) for r in result["results"]], [(ids[0], 200), (999, 404), (ids[2], 200)])
+        self.assertEqual(self.usage(), (1, 2))
+        self.assertEqual([os.path.exists(path) for path in paths], [False, True, False])
+
+    def test_stale_files_deleted_once(self):
+        self.upload("a.txt", b"abc")
+        files = list(self.user.files.all())
+        self.assertEqual(StoredFile.delete_all(files), {files[0].pk})
+        self.assertEqual(StoredFile.delete_all(files), set())
+        self.assertEqual(self.usage(), (0, 0))
+
+    def test_change(self):
+        file_id = self.upload("a.txt", b"abc")["file"]["id"]
+        result = self.post("/storage/bulk/change/", {"files": [
+            {"id": file_id, "description": "new"}, {"id": 999, "description": "x"}, {"id": file_id + 1}]})
+        self.assertEqual([r.get("ok") or r["error"] for r in result["results"]], [200, 404, 404])
+        self.assertEqual(result["results"][0]["file"]["description"], "new")
+        self.assertEqual(self.user.files.get().description, "new")
+        result = self.post("/storage/bulk/change/", {"files": [{"id": file_id, "description": 5}]})
+        self.assertEqual(result["results"][0]["error_msg"], "Invalid description")
+
+    def test_link(self):
+        file_id = self.upload("a.txt", b"abc")["file"]["id"]
+        result = self.post("/storage/bulk/link/", {"file_ids": [file_id, 999], "duration": 5})
+        self.assertEqual([r.get("ok") or r["error"] for r in result["results"]], [201, 404])
+        href = result["results"][0]["link"]["href"].split("=")[1]
+        self.assertEqual(Link.objects.get(href=href).to_file_id, file_id)
+
+    def test_admin_links_own_files_only(self):
+        file_id = self.upload("a.txt", b"abc")["file"]["id"]
+        User.objects.create_superuser("admin", "", "Passw0rd!")
+        admin = Client()
+        admin.login(username="admin", password="Passw0rd!")
+        result = admin.post("/storage/bulk/link/", {"file_ids": [file_id]}, content_type="application/json").json()
+        self.assertEqual(result["results"][0]["error"], 404)
+        self.assertFalse(Link.objects.exists())
+        # Files of other users are deleted by admin
+        result = admin.post("/storage/bulk/delete/", {"file_ids": [file_id]}, content_type="application/json").json()
+        self.assertEqual((result["results"][0]["ok"], self.usage()), (200, (0, 0)))
+
+
+class ArchiveTests(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ids = [self.upload(name, data)["file"]["id"] for name, data in
+                    (("a.txt", b"text " * 100), ("b.bin", bytes(range(256))), ("c.txt", b"c"))]
+
+    def download(self, **params) -> bytes:
+        response = self.client.get("/storage/archive/", params)
+        return b"".join(response.streaming_content)
+
+    def files(self) -> list:
+        return list(StoredFile.objects.only(*ARCHIVE_COLUMNS).order_by("name"))
+
+    def test_zip(self):
+        with zipfile.ZipFile(io.BytesIO(self.download(ids=f"{self.ids[0]},{self.ids[1]}"))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ["a.txt", "b.bin"])
+            self.assertEqual(archive.read("b.bin"), bytes(range(256)))
+            self.assertEqual([i.compress_type for i in archive.infolist()], [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+
+    def test_tar(self):
+        data = self.download(all=1, format="tar")
+        self.assertEqual(len(data) % tarfile.RECORDSIZE, 0)
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            self.assertEqual(archive.getnames(), ["a.txt", "b.bin", "c.txt"])
+            self.assertEqual(archive.extractfile("a.txt").read(), b"text " * 100)
+
+    def test_name_collision_and_missing_file(self):
+        files = self.files()
+        files[1].name = "a.txt"
+        os.remove(files[2].file.path)
+        with zipfile.ZipFile(io.BytesIO(b"".join(ArchiveChunks(files)))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ["a.txt", "a (1).txt"])
+            self.assertEqual(archive.read("a (1).txt"), bytes(range(256)))
+        with tarfile.open(fileobj=io.BytesIO(b"".join(ArchiveChunks(files, "tar")))) as archive:
+            self.assertEqual(archive.getnames(), ["a.txt", "a (1).txt"])
+
+    def test_bundle_link(self):
+        result = self.client.post("/storage/archive/link/", {"file_ids": self.ids[1:], "format": "tar"},
+                                  content_type="application/json").json()
+        self.assertEqual(result["ok"], 201)
+        self.client.logout()
+        response = self.client.get("/storage/get/", {"link": result["link"]["href"].split("=")[1]})
+        self.assertEqual(response["Content-Type"], "application/x-tar")
+        with tarfile.open(fileobj=io.BytesIO(b"".join(response.streaming_content))) as archive:
+            self.assertEqual(archive.getnames(), ["b.bin", "c.txt"])
+            self.assertEqual(archive.extractfile("c.txt").read(), b"c")
+
+
+class LinkLimitTests(StorageTestCase):
+
+    def test_valid_links_not_limited(self):
+        file_id = self.upload("a.txt", b"abc")["file"]["id"]
+        href = Link.objects.create(to_file_id=file_id).href
+        bucket = TokenBucket(LocalCache(), rate=0.001, capacity=1)
+        with mock.patch("storage.views.link_limiter", bucket):
+            self.assertEqual(self.client.get("/storage/get/", {"link": "x"}).status_code, 200)
+            self.assertEqual(self.client.get("/storage/get/", {"link": "x"}).status_code, 429)
+            response = self.client.get("/storage/get/", {"link": href})
+            self.assertEqual(b"".join(response.streaming_content), b"abc")
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from back.settings import UPLOAD_CHUNK_SIZE, UPLOAD_DIR
+
+
+def upload_dir() -> str:
+    """ Dir of temp upload files and upload session parts, in storage dir of current settings (same file system) """
+    path = os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class QuotaUploadHandler(FileUploadHandler):
+    """
+        Count bytes of uploaded file while they are streamed in
+        and abort upload as soon as owner's quota is exceeded.
+        Must be the first handler in request.upload_handlers
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.user = request.user
+        self.error = ""
+        self.received = 0
+        self.replaced = None
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.received = 0
+        exist = self.user.files.filter(name=file_name).only("size_bytes").first()
+        self.replaced = exist.size_bytes if exist else None
+        self.check(0 if exist else 1)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        self.check(0)
+        return raw_data
+
+    def check(self, files: int):
+        self.error = self.user.quota_error(files, self.received - (self.replaced or 0))
+        if self.error:
+            raise StopUpload(connection_reset=True)
+
+    def file_complete(self, file_size):
+        return None
+
+
+class StorageUploadHandler(FileUploadHandler):
+    """
+        Write uploaded file straight into temp file on the same file system as storage (upload_dir),
+        size and SHA-256 are computed in the same pass, storage moves the file into place by rename
+        (default handlers buffer file in /tmp, so storage copies every byte once more)
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.hash = None
+        self.sha256 = None
+        # No 'file' attribute until new_file: on StopUpload Django closes 'file' of every handler that has it
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        fd, path = tempfile.mkstemp(dir=upload_dir(), suffix=".upload")
+        self.file = StorageUploadedFile(os.fdopen(fd, "w+b"), path, self.file_name, self.content_type,
+                                        self.charset, self.content_type_extra)
+        self.hash = hashlib.sha256()
+        self.sha256 = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+        # Chunk isn't passed to other handlers
+        return None
+
+    def file_complete(self, file_size):
+        self.sha256 = self.hash.hexdigest()
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
+
+
+class StorageUploadedFile(UploadedFile):
+    """ Uploaded file in upload_dir, it's removed on close unless storage has moved it """
+
+    def __init__(self, file, path, name, content_type, charset, content_type_extra=None):
+        super().__init__(file, name, content_type, 0, charset, content_type_extra)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class PartFile(File):
+    """ Received part file of upload session, storage moves it into place by rename """
+
+    def __init__(self, path, name):
+        super().__init__(open(path, "rb"), name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def file_sha256(path) -> str:
+    hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+def write_chunk(stream, path, offset: int, length: int) -> int:
+    """ Copy up to length bytes from stream into file at offset, returns number of written bytes """
+
+    fd = os.open(path, os.O_WRONLY)
+    written = 0
+    try:
+        while written < length:
+            data = stream.read(min(UPLOAD_CHUNK_SIZE, length - written))
+            if not data:
+                break
+            written += os.pwrite(fd, data, offset + written)
+    finally:
+        os.close(fd)
+    return written
@@ -1,12 +1,28 @@
 from django.urls import path
 
+from back.settings import ASYNC_VIEWS
 from storage.views import file_list, file_get_change_del, file_upload, file_download, link_create, link_download
+from storage.views import upload_session_create, upload_session_get_put_del, upload_session_commit
+from storage.views import bulk_delete, bulk_change, bulk_link, archive_download, archive_link_create
+from storage.views import afile_upload, afile_download, alink_download, aarchive_download
+
+if ASYNC_VIEWS:
+    file_upload, file_download, link_download = afile_upload, afile_download, alink_download
+    archive_download = aarchive_download
 
 urlpatterns = [
     path("storage/", file_list, name="file_list"),
     path("storage/upload/", file_upload, name="file_upload"),
+    path("storage/upload/session/", upload_session_create, name="upload_session_create"),
+    path("storage/upload/session/<uuid:pk>/", upload_session_get_put_del, name="upload_session_gpd"),
+    path("storage/upload/session/<uuid:pk>/commit/", upload_session_commit, name="upload_session_commit"),
     path("storage/file/<int:pk>/download/", file_download, name="file_download"),
     path("storage/file/<int:pk>/", file_get_change_del, name="file_gcd"),
     path("storage/file/link/", link_create, name="link_create"),
+    path("storage/bulk/delete/", bulk_delete, name="bulk_delete"),
+    path("storage/bulk/change/", bulk_change, name="bulk_change"),
+    path("storage/bulk/link/", bulk_link, name="bulk_link"),
+    path("storage/archive/", archive_download, name="archive_download"),
+    path("storage/archive/link/", archive_link_create, name="archive_link_create"),
     path("storage/get/", link_download, name="link_download"),
 ]
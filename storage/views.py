@@ -1,23 +1,94 @@
-from datetime import timedelta
-
-from django.http import JsonResponse, HttpResponse
-
-from back.settings import logger, OK_200, FILE_404, ERROR_SOME
-from back.utils import auth_required, allowed_methods, parse_body, valid_filename
-from storage.models import StoredFile, Link
+import re
+from datetime import datetime, timedelta, timezone
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+
+from back.settings import logger, OK_200, FILE_404, ERROR_SOME, ERROR_BAD_CURSOR, ERROR_BAD_FIELDS
+from back.settings import FILE_LIST_LIMIT, FILE_LIST_MAX_LIMIT, ERROR_SESSION_404, ERROR_BAD_UPLOAD, ERROR_BAD_CHUNK
+from back.settings import BULK_MAX_FILES, ERROR_BAD_BULK, FILE_LIST_STREAM_BATCH, ASYNC_VIEWS
+from back.settings import UPLOAD_SESSION_MAX_SIZE, UPLOAD_SESSION_MAX_COUNT
+from back.utils import auth_required, allowed_methods, parse_body, valid_filename, encode_cursor, decode_cursor
+from back.utils import valid_int, not_modified, set_validators, json_stream, JsonResponse
+from storage.archive import ARCHIVE_COLUMNS, ARCHIVE_TYPES, archive_response
+from storage.cache import forget_links
+from storage.download import AsyncChunks, send_file, asend_file
+from storage.extract import ExtractError, extract_upload
+from storage.models import StoredFile, Link, UploadSession, FILE_FIELDS, file_columns, serialize_rows
+from storage.ratelimit import link_limiter, client_ip
+from storage.uploads import QuotaUploadHandler, StorageUploadHandler, PartFile, file_sha256, write_chunk
+from users.models import User
 
 
 @auth_required
 @allowed_methods("GET")
 def file_list(request):
-    """  GET - List of files in current user's storage """
+    """
+        GET - List of files in current user's storage, ordered by name
+        query params:
+            limit - number of files per page
+            cursor - 'next' value from previous page
+            fields - comma separated file fields to return (all by default)
+            all - return all files without pagination
+            stream - (with all) stream list while files are fetched from DB, for very large lists
+    """
 
-    return JsonResponse(
+    # List is not serialized (and files are not fetched) if client has actual version of it
+    etag, last_modified = request.user.files_validators()
+    response = not_modified(request, etag, last_modified)
+    if response:
+        return response
+
+    fields = FILE_FIELDS
+    if request.GET.get("fields"):
+        fields = request.GET["fields"].split(",")
+        if not set(fields) <= FILE_FIELDS.keys():
+            return JsonResponse(ERROR_BAD_FIELDS)
+
+    # Rows are serialized without building model instances, name and pk are the pagination key
+    files = request.user.files.order_by("name", "id")
+    if request.GET.get("all"):
+        rows = files.values_list(*file_columns(fields))
+        if request.GET.get("stream"):
+            content = json_stream(
+                {"ok": 200, "user": request.user.serializer}, "files",
+                serialize_rows(rows.iterator(chunk_size=FILE_LIST_STREAM_BATCH), fields), FILE_LIST_STREAM_BATCH)
+            response = StreamingHttpResponse(
+                AsyncChunks(content, thread_sensitive=True) if ASYNC_VIEWS else content,
+                content_type="application/json")
+            return set_validators(response, etag, last_modified)
+        return set_validators(JsonResponse(
+            {
+                "ok": 200,
+                "user": request.user.serializer,
+                "files": list(serialize_rows(rows, fields)),
+            }), etag, last_modified)
+
+    limit = request.GET.get("limit", str(FILE_LIST_LIMIT))
+    if not limit.isdigit() or not 0 < int(limit) <= FILE_LIST_MAX_LIMIT:
+        return JsonResponse(ERROR_BAD_CURSOR)
+    limit = int(limit)
+
+    if request.GET.get("cursor"):
+        cursor = decode_cursor(request.GET["cursor"])
+        if not cursor or len(cursor) != 2:
+            return JsonResponse(ERROR_BAD_CURSOR)
+        name, pk = cursor
+        if not isinstance(name, str) or not valid_int(pk):
+            return JsonResponse(ERROR_BAD_CURSOR)
+        files = files.filter(Q(name__gt=name) | Q(name=name, pk__gt=pk))
+
+    page = list(files.values_list(*file_columns(fields), "name", "id")[:limit + 1])
+    next_cursor = encode_cursor(*page[limit - 1][-2:]) if len(page) > limit else None
+    return set_validators(JsonResponse(
         {
             "ok": 200,
             "user": request.user.serializer,
-            "files": [f.serializer for f in request.user.files.all()],
-        })
+            "files": list(serialize_rows(page[:limit], fields)),
+            "next": next_cursor,
+        }), etag, last_modified)
 
 
 @auth_required
@@ -39,7 +110,11 @@ def file_get_change_del(request, pk: int):
 
 #  Get file info
     if request.method == "GET":
-        return JsonResponse({"ok": 200, "file": file.serializer})
+        etag, last_modified = file.info_etag, file.info_modified
+        response = not_modified(request, etag, last_modified)
+        if response:
+            return response
+        return set_validators(JsonResponse({"ok": 200, "file": file.serializer}), etag, last_modified)
 
 #  Change filename and description
     if request.method == "PATCH":
@@ -51,7 +126,7 @@ def file_get_change_del(request, pk: int):
             return JsonResponse({"error": 400, "error_msg": err})
 
         file.description = data.get("description", file.description)[:511]
-        file.save()
+        file.save(update_fields=["description", "updated_at"])
         logger.info(f"User: {request.user} | Action: change file {file.pk}: {file.name}")
         return JsonResponse({"ok": 200, "file": file.serializer})
 
@@ -59,14 +134,83 @@ def file_get_change_del(request, pk: int):
     if request.method == "DELETE":
         pk = file.pk
         filename = file.name
-        file.file.delete()
-        file.delete()
+        if not file.remove():
+            return JsonResponse(FILE_404)
         logger.info(f"User: {request.user} | Action: delete file {pk}: {filename}")
         return JsonResponse(OK_200)
 
     return JsonResponse(ERROR_SOME)
 
 
+def bulk_files(request, ids, any_owner=True):
+    """
+        Files of bulk request (any files for admin if any_owner)
+        returns: ({pk: file} of found files, list of unique pks in request order) or (None, None) if list is invalid
+    """
+
+    if not isinstance(ids, list) or not 0 < len(ids) <= BULK_MAX_FILES or not all(valid_int(pk) for pk in ids):
+        return None, None
+    pks = list(dict.fromkeys(ids))
+    files = StoredFile.objects if any_owner and request.user.is_superuser else request.user.files
+    return files.select_related("owner").in_bulk(pks), pks
+
+
+@auth_required
+@allowed_methods("POST")
+def bulk_delete(request):
+    """
+        POST - delete files in one transaction
+        body params:
+            file_ids - list of pks of stored files
+    """
+
+    files, pks = bulk_files(request, parse_body(request).get("file_ids"))
+    if files is None:
+        return JsonResponse(ERROR_BAD_BULK)
+
+    deleted = StoredFile.delete_all(list(files.values()))
+    logger.info(f"User: {request.user} | Action: delete files {sorted(deleted)}")
+    return JsonResponse({
+        "ok": 200,
+        "results": [{"id": pk, **(OK_200 if pk in deleted else FILE_404)} for pk in pks],
+    })
+
+
+@auth_required
+@allowed_methods("POST")
+def bulk_change(request):
+    """
+        POST - change descriptions of files in one transaction
+        body params:
+            files - list of {"id": pk of stored file, "description": new description}
+    """
+
+    items = parse_body(request).get("files")
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return JsonResponse(ERROR_BAD_BULK)
+    files, pks = bulk_files(request, [item.get("id") for item in items])
+    if files is None:
+        return JsonResponse(ERROR_BAD_BULK)
+
+    results = {}
+    now = datetime.now(timezone.utc)
+    for item in items:
+        file = files.get(item["id"])
+        if not file:
+            results[item["id"]] = {"id": item["id"], **FILE_404}
+        elif not isinstance(item.get("description"), str):
+            results[item["id"]] = {"id": item["id"], "error": 400, "error_msg": "Invalid description"}
+        else:
+            file.description = item["description"][:511]
+            file.updated_at = now
+            results[item["id"]] = {"id": item["id"], "ok": 200, "file": file.serializer}
+
+    changed = [files[pk] for pk, result in results.items() if "ok" in result]
+    StoredFile.objects.bulk_update(changed, ["description", "updated_at"])
+    logger.info(f"User: {request.user} | Action: change files {[f.pk for f in changed]}")
+    return JsonResponse({"ok": 200, "results": [results[pk] for pk in pks]})
+
+
 @auth_required
 @allowed_methods("POST")
 def file_upload(request):
@@ -74,37 +218,78 @@ def file_upload(request):
         POST - Upload file to FileStorage
         body params:
             force - Force to rewrite existing file
+            extract - Store files of uploaded zip/tar archive instead of archive itself
+    """
+
+    quota = QuotaUploadHandler(request)
+    receiver = StorageUploadHandler(request)
+    request.upload_handlers[:0] = [quota, receiver]
+    return store_upload(request, quota, receiver)
+
+
+@auth_required
+@allowed_methods("POST")
+async def afile_upload(request):
     """
+        Async version of file_upload (ASGI)
+        Request body is already received by ASGI handler without holding a thread,
+        it's parsed and stored in DB (transaction) in sync thread
+        Django's ASGI handler spools the whole body into a temp file before the view runs, so unlike WSGI
+        over-quota upload isn't cut off early (QuotaUploadHandler rejects it after it's received) and content
+        is written twice (spooled body, then StorageUploadHandler's file). See README for routing uploads to WSGI
+    """
+
+    quota = QuotaUploadHandler(request)
+    receiver = StorageUploadHandler(request)
+    request.upload_handlers[:0] = [quota, receiver]
+    return await sync_to_async(store_upload)(request, quota, receiver)
+
+
+def store_upload(request, quota, receiver):
+    """ Save uploaded file (request body is parsed by quota and storage handlers) """
 
     if "file" in request.FILES:
         file = request.FILES["file"]
+        description = request.POST.get("description", "")[:511]
+        if request.POST.get("extract"):
+            return extract_response(request, file, description)
+        stored, created, err = StoredFile.upload(
+            request.user, file.name, file, description, bool(request.POST.get("force")), receiver.sha256)
 
-        if not valid_filename(file.name):
-            logger.error(f"User: {request.user} | Action: upload file {file.name} | Invalid filename!")
-            return JsonResponse({"error": 400, "error_msg": f"Invalid filename - '{file.name}'"})
+        if err:
+            logger.error(f"User: {request.user} | Action: upload file {file.name} | {err}")
+            return JsonResponse({"error": 400, "error_msg": err})
+        if not created:
+            logger.info(f"User: {request.user}. Action: overwrite file {stored.pk}: {stored.name}")
+            return JsonResponse({"ok": 200, "file": stored.serializer})
+        logger.info(f"User: {request.user} | Action: upload file {stored.pk}: {stored.name}")
+        return JsonResponse({"ok": 201, "file": stored.serializer})
 
-        description = request.POST.get("description", "")[:511]
-        exist = request.user.files.filter(name=file.name).first()
-        if exist:
-            if request.POST.get("force"):
-                exist.file.delete()
-                Link.objects.filter(to_file=exist).delete()
-                exist.file = file
-                exist.description = description or exist.description
-                exist.downloads = 0
-                exist.save()
-                logger.info(f"User: {request.user}. Action: overwrite file {exist.pk}: {exist.name}")
-                return JsonResponse({"ok": 200, "file": exist.serializer})
-            logger.error(f"User: {request.user} | Action: upload file {file.name} | File already exists!")
-            return JsonResponse({"error": 400, "error_msg": f"File '{file.name}' already exists!"})
-
-        new = StoredFile.objects.create(name=file.name, owner=request.user, file=file, description=description)
-        logger.info(f"User: {request.user} | Action: upload file {new.pk}: {new.name}")
-        return JsonResponse({"ok": 201, "file": new.serializer})
+    if quota.error:
+        logger.error(f"User: {request.user} | Action: upload file {quota.file_name} | {quota.error}")
+        return JsonResponse({"error": 400, "error_msg": quota.error})
 
     return JsonResponse(OK_200)
 
 
+def extract_response(request, archive, description):
+    """ Store files of uploaded archive, returns results per file of archive """
+
+    try:
+        results = extract_upload(request.user, archive, description, bool(request.POST.get("force")))
+    except ExtractError as e:
+        logger.error(f"User: {request.user} | Action: extract archive {archive.name} | {e}")
+        return JsonResponse({"error": 400, "error_msg": str(e)})
+
+    stored = [r["file"]["id"] for r in results if "ok" in r]
+    if not stored:
+        logger.error(f"User: {request.user} | Action: extract archive {archive.name} | No files extracted!")
+        return JsonResponse({"error": 400, "error_msg": "No files extracted", "results": results})
+    logger.info(f"User: {request.user} | Action: extract archive {archive.name} into files {stored}")
+    # 201 if any file is created, 200 if existing files are overwritten only
+    return JsonResponse({"ok": max(r.get("ok", 0) for r in results), "results": results})
+
+
 @auth_required
 @allowed_methods("GET")
 def file_download(request, pk: int):
@@ -117,17 +302,37 @@ def file_download(request, pk: int):
         file = StoredFile.objects.filter(pk=pk).first()
     else:
         file = request.user.files.filter(pk=pk).first()
-    if not file or not file.exists:
+    if not file:
         return HttpResponse("<h1>File not found!</h1>")
 
-    with open(file.file.path, 'rb') as f:
-        response = HttpResponse(f.read())
-        response["Content-Type"] = "application/octet-stream"
-        response["Content-Disposition"] = f"attachment; filename='{file.name}'"
-        file.downloads += 1
-        file.save()
-        logger.info(f"User: {request.user} | Action: download file {file.pk}: {file.name}")
-        return response
+    try:
+        response = send_file(request, file)
+    except FileNotFoundError:
+        logger.error(f"User: {request.user} | Action: download file {file.pk}: {file.file.name} | File not found!")
+        return HttpResponse("<h1>File not found!</h1>")
+    logger.info(f"User: {request.user} | Action: download file {file.pk}: {file.name}")
+    return response
+
+
+@auth_required
+@allowed_methods("GET")
+async def afile_download(request, pk: int):
+    """ Async version of file_download (ASGI), slow clients don't hold threads """
+
+    if request.user.is_superuser:
+        file = await StoredFile.objects.filter(pk=pk).afirst()
+    else:
+        file = await request.user.files.filter(pk=pk).afirst()
+    if not file:
+        return HttpResponse("<h1>File not found!</h1>")
+
+    try:
+        response = await asend_file(request, file)
+    except FileNotFoundError:
+        logger.error(f"User: {request.user} | Action: download file {file.pk}: {file.file.name} | File not found!")
+        return HttpResponse("<h1>File not found!</h1>")
+    logger.info(f"User: {request.user} | Action: download file {file.pk}: {file.name}")
+    return response
 
 
 @auth_required
@@ -142,7 +347,7 @@ def link_create(request):
 
     data = parse_body(request)
     pk = data.get("file_id")
-    if not isinstance(pk, int):
+    if not valid_int(pk):
         logger.error(f"User: {request.user} | Action: create download link to file {pk} | Invalid file id!")
         return JsonResponse({"error": 400, "error_msg": "Invalid file id"})
 
@@ -152,14 +357,145 @@ def link_create(request):
         return JsonResponse(FILE_404)
 
     link = Link.objects.create(to_file=file)
+    forget_links([link.href])
     delta = data.get("duration")
-    if isinstance(delta, int) and delta > 0:
+    if valid_int(delta) and delta > 0:
         link.expire_at = link.created_at + timedelta(minutes=delta)
         link.save()
     logger.info(f"User: {request.user} | Action: create download link to file {file.pk}: {file.name}")
     return JsonResponse({"ok": 201, "link": link.serializer})
 
 
+@auth_required
+@allowed_methods("POST")
+def bulk_link(request):
+    """
+        POST - create links for downloading of files
+        body params:
+            file_ids - list of pks of stored files
+            duration - links' lifetime in minutes
+    """
+
+    data = parse_body(request)
+    # Public links are created to own files only (as by link_create), admin's scope is for delete and change
+    files, pks = bulk_files(request, data.get("file_ids"), any_owner=False)
+    if files is None:
+        return JsonResponse(ERROR_BAD_BULK)
+
+    expire_at = None
+    delta = data.get("duration")
+    if valid_int(delta) and delta > 0:
+        expire_at = datetime.now(timezone.utc) + timedelta(minutes=delta)
+    links = Link.objects.bulk_create(
+        [Link(to_file=files[pk], expire_at=expire_at) for pk in pks if pk in files and files[pk].exists])
+    forget_links([link.href for link in links])
+
+    linked = {link.to_file_id: link for link in links}
+    logger.info(f"User: {request.user} | Action: create download links to files {list(linked)}")
+    return JsonResponse({
+        "ok": 200,
+        "results": [{"id": pk, "ok": 201, "link": linked[pk].serializer} if pk in linked else {"id": pk, **FILE_404}
+                    for pk in pks],
+    })
+
+
+def archive_files(request, ids, all_files, archive_format):
+    """
+        Current user's files to put into archive: listed by pks or all files
+        returns: (files queryset, None) or (None, error message)
+    """
+
+    if archive_format not in ARCHIVE_TYPES:
+        return None, f"Unknown archive format - '{archive_format}'"
+    if all_files:
+        return request.user.files.all(), None
+    if not isinstance(ids, list) or not 0 < len(ids) <= BULK_MAX_FILES or not all(valid_int(pk) for pk in ids):
+        return None, ERROR_BAD_BULK["error_msg"]
+    return request.user.files.filter(pk__in=ids), None
+
+
+def archive_params(request):
+    """ Params of archive download: ids - comma separated pks, all - all files, format - zip (default) or tar """
+    ids = request.GET.get("ids", "")
+    ids = [int(pk) for pk in ids.split(",")] if re.fullmatch(r"\d+(,\d+)*", ids) else None
+    return ids, bool(request.GET.get("all")), request.GET.get("format", "zip")
+
+
+@auth_required
+@allowed_methods("GET")
+def archive_download(request):
+    """
+        GET - download archive of files built on the fly
+        query params:
+            ids - comma separated pks of stored files
+            all - archive all files of current user
+            format - zip (default) or tar
+    """
+
+    ids, all_files, archive_format = archive_params(request)
+    files, err = archive_files(request, ids, all_files, archive_format)
+    if err:
+        logger.error(f"User: {request.user} | Action: download archive | {err}")
+        return HttpResponse(f"<h1>{err}</h1>")
+
+    files = list(files.only(*ARCHIVE_COLUMNS).order_by("name", "id"))
+    logger.info(f"User: {request.user} | Action: download archive of {len(files)} files ({archive_format})")
+    return archive_response(files, archive_format)
+
+
+@auth_required
+@allowed_methods("GET")
+async def aarchive_download(request):
+    """ Async version of archive_download (ASGI), archive is streamed without holding a thread """
+
+    ids, all_files, archive_format = archive_params(request)
+    files, err = archive_files(request, ids, all_files, archive_format)
+    if err:
+        logger.error(f"User: {request.user} | Action: download archive | {err}")
+        return HttpResponse(f"<h1>{err}</h1>")
+
+    files = [f async for f in files.only(*ARCHIVE_COLUMNS).order_by("name", "id")]
+    logger.info(f"User: {request.user} | Action: download archive of {len(files)} files ({archive_format})")
+    return archive_response(files, archive_format, True)
+
+
+@auth_required
+@allowed_methods("POST")
+def archive_link_create(request):
+    """
+        POST - create link for downloading archive of files
+        body params:
+            file_ids - list of pks of stored files
+            all - link to archive of all files of current user (including files uploaded later)
+            format - zip (default) or tar
+            duration - link's lifetime in minutes
+    """
+
+    data = parse_body(request)
+    all_files = bool(data.get("all"))
+    archive_format = data.get("format", "zip")
+    files, err = archive_files(request, data.get("file_ids"), all_files, archive_format)
+    if err:
+        logger.error(f"User: {request.user} | Action: create download link to archive | {err}")
+        return JsonResponse({"error": 400, "error_msg": err})
+
+    pks = [] if all_files else list(files.values_list("pk", flat=True))
+    if not all_files and not pks:
+        logger.error(f"User: {request.user} | Action: create download link to archive | Files not found!")
+        return JsonResponse(FILE_404)
+
+    link = Link(owner=request.user, all_files=all_files, archive=archive_format)
+    delta = data.get("duration")
+    if valid_int(delta) and delta > 0:
+        link.expire_at = datetime.now(timezone.utc) + timedelta(minutes=delta)
+    with transaction.atomic():
+        link.save()
+        link.files.set(pks)
+    forget_links([link.href])
+    logger.info(f"User: {request.user} | Action: create download link to archive of {len(pks) or 'all'} files")
+    return JsonResponse({"ok": 201, "link": link.serializer})
+
+
 @allowed_methods("GET")
 def link_download(request):
     """
@@ -168,26 +504,229 @@ def link_download(request):
             link - link to stored file
     """
 
+    data, response = resolve_link(request)
+    if response:
+        return response
+
+    if "bundle" in data:
+        files = list(Link.bundle_files(data).only(*ARCHIVE_COLUMNS).order_by("name", "id"))
+        logger.info(f"Action: download archive via link of {len(files)} files, owner - {data['owner']}")
+        return archive_response(files, data["format"])
+
+    file = StoredFile(
+        pk=data["file_id"], file=data["path"], name=data["name"], size_bytes=data["size"],
+        updated_at=data["updated_at"], sha256=data.get("sha256", ""),
+        compressed=data.get("compressed", False))
+    try:
+        response = send_file(request, file)
+    except FileNotFoundError:
+        logger.error(f"Action: download file {file.pk}: {data['path']} via link | File not found!")
+        return HttpResponse("<h1>File not found!</h1>")
+
+    logger.info(f"Action: download file via link {file.pk}: {file.name}, owner - {data['owner']}")
+    return response
+
+
+@allowed_methods("GET")
+async def alink_download(request):
+    """ Async version of link_download (ASGI), slow clients don't hold threads """
+
+    data, response = await sync_to_async(resolve_link)(request)
+    if response:
+        return response
+
+    if "bundle" in data:
+        files = [f async for f in Link.bundle_files(data).only(*ARCHIVE_COLUMNS).order_by("name", "id")]
+        logger.info(f"Action: download archive via link of {len(files)} files, owner - {data['owner']}")
+        return archive_response(files, data["format"], True)
+
+    file = StoredFile(
+        pk=data["file_id"], file=data["path"], name=data["name"], size_bytes=data["size"],
+        updated_at=data["updated_at"], sha256=data.get("sha256", ""),
+        compressed=data.get("compressed", False))
+    try:
+        response = await asend_file(request, file)
+    except FileNotFoundError:
+        logger.error(f"Action: download file {file.pk}: {data['path']} via link | File not found!")
+        return HttpResponse("<h1>File not found!</h1>")
+
+    logger.info(f"Action: download file via link {file.pk}: {file.name}, owner - {data['owner']}")
+    return response
+
+
+def resolve_link(request):
+    """
+        Find linked file by link from query (with limit of invalid links per client IP)
+        returns: (file data - see Link.cache_data, None) or (None, error response)
+    """
+
     href = request.GET.get("link", "")
-    link = Link.objects.filter(href=href).first()
-    if not link:
+    data = Link.resolve(href)
+    if not data:
+        # Only lookups of unknown links take tokens, valid links are served to any client
+        ip = client_ip(request)
+        if link_limiter and not link_limiter.consume(ip):
+            # Rejected scans are not logged by django.request one by one (see RejectedFilter)
+            return None, HttpResponse("<h1>Too many invalid links!</h1>", status=429)
         logger.error(f"Action: download file via link '{href}' | Invalid Link!")
-        return HttpResponse("<h1>Invalid Link!</h1>")
+        if link_limiter and not link_limiter.allowed(ip):
+            logger.error(f"Action: download file via link | Too many invalid links from {ip}, blocked!")
+        return None, HttpResponse("<h1>Invalid Link!</h1>")
 
-    if link.expired:
+    if data["expire_at"] and data["expire_at"] < datetime.now(timezone.utc):
         logger.error(f"Action: download file via link '{href}' | Link has expired!")
-        return HttpResponse("<h1>Link has expired!</h1>")
+        return None, HttpResponse("<h1>Link has expired!</h1>")
 
-    if not link.to_file.exists:
-        logger.error(
-            f"Action: download file {link.to_file.pk}: {link.to_file.dir}/{link.to_file.name} via link | File not found!")
-        return HttpResponse("<h1>File not found!</h1>")
+    return data, None
 
-    with open(link.to_file.file.path, 'rb') as f:
-        response = HttpResponse(f.read())
-        response["Content-Type"] = "application/octet-stream"
-        response["Content-Disposition"] = f"attachment; filename='{link.to_file.name}'"
-        link.to_file.downloads += 1
-        link.to_file.save()
-        logger.info(f"Action: download file via link {link.to_file.pk}: {link.to_file.name}, owner - {link.to_file.owner}")
-        return response
+
+@auth_required
+@allowed_methods("POST")
+def upload_session_create(request):
+    """
+        POST - start resumable upload, file is sent by chunks then committed
+        body params:
+            filename - name of file
+            size - size of file in bytes
+            sha256 - checksum of file (hex), verified on commit
+            description - file description
+            force - Force to rewrite existing file
+    """
+
+    data = parse_body(request)
+    name = data.get("filename", "")
+    size = data.get("size")
+    sha256 = str(data.get("sha256", "")).lower()
+
+    if not valid_filename(name):
+        logger.error(f"User: {request.user} | Action: start upload {name} | Invalid filename!")
+        return JsonResponse({"error": 400, "error_msg": f"Invalid filename - '{name}'"})
+    if not valid_int(size) or size < 0 or not re.fullmatch(r"[0-9a-f]{64}", sha256):
+        logger.error(f"User: {request.user} | Action: start upload {name} | Invalid size or checksum!")
+        return JsonResponse(ERROR_BAD_UPLOAD)
+    if UPLOAD_SESSION_MAX_SIZE and size > UPLOAD_SESSION_MAX_SIZE:
+        logger.error(f"User: {request.user} | Action: start upload {name} | File is too large!")
+        return JsonResponse({"error": 400, "error_msg": f"File is too large (max {UPLOAD_SESSION_MAX_SIZE} bytes)"})
+
+    exist = request.user.files.filter(name=name).first()
+    if exist and not data.get("force"):
+        logger.error(f"User: {request.user} | Action: start upload {name} | File already exists!")
+        return JsonResponse({"error": 400, "error_msg": f"File '{name}' already exists!"})
+
+    UploadSession.purge(request.user.uploads.all())
+    with transaction.atomic():
+        # Owner's row is locked, so parallel sessions are checked against limits one by one
+        owner = User.objects.select_for_update().get(pk=request.user.pk)
+        files, reserved = UploadSession.reserved(owner)
+        if owner.uploads.count() >= UPLOAD_SESSION_MAX_COUNT:
+            err = f"Too many unfinished uploads (max {UPLOAD_SESSION_MAX_COUNT})"
+        else:
+            # Space of open sessions is taken already (part files are allocated at full size)
+            err = owner.quota_error((0 if exist else 1) + files, size - (exist.size_bytes if exist else 0) + reserved)
+        if err:
+            logger.error(f"User: {request.user} | Action: start upload {name} | {err}")
+            return JsonResponse({"error": 400, "error_msg": err})
+
+        session = UploadSession.objects.create(
+            owner=owner, name=name, size_bytes=size, sha256=sha256,
+            description=str(data.get("description", ""))[:511], force=bool(data.get("force")))
+    try:
+        session.allocate()
+    except OSError as e:
+        session.abort()
+        logger.error(f"User: {request.user} | Action: start upload {name} | {e}")
+        return JsonResponse({"error": 400, "error_msg": "Not enough space in storage"})
+
+    logger.info(f"User: {request.user} | Action: start upload {session.id}: {name}")
+    return JsonResponse({"ok": 201, "session": session.serializer})
+
+
+def find_session(request, pk):
+    """ Current user's upload session, expired session is deleted (with its part file) and not found """
+
+    session = request.user.uploads.filter(pk=pk).first()
+    if session and session.expired:
+        session.abort()
+        return None
+    return session
+
+
+@auth_required
+@allowed_methods("GET", "PUT", "DELETE")
+def upload_session_get_put_del(request, pk):
+    """
+        url param pk: id of upload session
+        GET - get session info with received ranges
+        PUT - send chunk of file, request body is raw chunk data
+            query params:
+                offset - position of chunk in file
+        DELETE - abort upload
+    """
+
+    session = find_session(request, pk)
+    if not session:
+        return JsonResponse(ERROR_SESSION_404)
+
+#  Get session info
+    if request.method == "GET":
+        return JsonResponse({"ok": 200, "session": session.serializer})
+
+#  Write chunk at offset
+    if request.method == "PUT":
+        offset = request.GET.get("offset", "")
+        length = request.META.get("CONTENT_LENGTH") or ""
+        if not offset.isdigit() or not length.isdigit() or int(offset) + int(length) > session.size_bytes:
+            logger.error(f"User: {request.user} | Action: upload chunk {session.id} | Invalid offset or length!")
+            return JsonResponse(ERROR_BAD_CHUNK)
+
+        offset = int(offset)
+        written = write_chunk(request, session.path, offset, int(length))
+        if written:
+            session.add_range(offset, offset + written)
+        return JsonResponse({"ok": 200, "session": session.serializer})
+
+#  Abort upload
+    if request.method == "DELETE":
+        session.abort()
+        logger.info(f"User: {request.user} | Action: abort upload {pk}: {session.name}")
+        return JsonResponse(OK_200)
+
+    return JsonResponse(ERROR_SOME)
+
+
+@auth_required
+@allowed_methods("POST")
+def upload_session_commit(request, pk):
+    """
+        url param pk: id of upload session
+        POST - verify checksum of received file and move it to storage
+    """
+
+    session = find_session(request, pk)
+    if not session:
+        return JsonResponse(ERROR_SESSION_404)
+    if not session.complete:
+        logger.error(f"User: {request.user} | Action: commit upload {session.id} | Upload is not complete!")
+        return JsonResponse({"error": 400, "error_msg": "Upload is not complete", "session": session.serializer})
+
+    sha256 = file_sha256(session.path)
+    if sha256 != session.sha256:
+        # Some chunks are corrupted - all chunks have to be sent again
+        session.received = []
+        session.save(update_fields=["received"])
+        logger.error(f"User: {request.user} | Action: commit upload {session.id} | Checksum mismatch!")
+        return JsonResponse({"error": 400, "error_msg": "Checksum mismatch", "session": session.serializer})
+
+    content = PartFile(session.path, session.name)
+    try:
+        stored, created, err = StoredFile.upload(
+            request.user, session.name, content, session.description, session.force, sha256)
+    finally:
+        content.close()
+    if err:
+        logger.error(f"User: {request.user} | Action: commit upload {session.id} | {err}")
+        return JsonResponse({"error": 400, "error_msg": err})
+
+    session.abort()
+    logger.info(f"User: {request.user} | Action: upload file {stored.pk}: {stored.name} (resumable)")
+    return JsonResponse({"ok": 201 if created else 200, "file": stored.serializer})
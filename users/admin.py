@@ -1,17 +1,32 @@
 from django.contrib import admin
 
-from storage.models import StoredFile
+from storage.admin import set_uploaded_content
+from storage.models import StoredFile, CONTENT_FIELDS
 from users.models import User
 
 
 class FileInline(admin.TabularInline):
     model = StoredFile
     extra = 1
+    readonly_fields = CONTENT_FIELDS
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ["pk", "username", "first_name", "last_name", "files_count", "total_size", "is_superuser", "uuid"]
     list_display_links = ("username",)
-    fields = ["username", ("first_name", "last_name"), "email", "is_superuser"]
+    fields = ["username", ("first_name", "last_name"), "email", "is_superuser", ("quota_files", "quota_size")]
     inlines = (FileInline,)
+
+    def save_formset(self, request, form, formset, change):
+        uploaded = [f for f in formset.forms if "file" in f.changed_data and f not in formset.deleted_forms]
+        for f in uploaded:
+            # Owner of new file is set by formset on save, but content is stored under owner's dir before it
+            f.instance.owner = form.instance
+            set_uploaded_content(f.instance, f.cleaned_data["file"])
+        super().save_formset(request, form, formset, change)
+        [f.instance.compress_content() for f in uploaded]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.recount_usage()
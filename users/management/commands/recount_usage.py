@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild users' files count and total size from stored files"
+
+    def handle(self, *args, **options):
+        count = 0
+        for user in User.objects.iterator():
+            user.recount_usage()
+            count += 1
+        self.stdout.write(f"Usage recounted for {count} users")
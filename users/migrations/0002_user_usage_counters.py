@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:43
+
+from django.db import migrations, models
+
+
+def fill_usage(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    for user in User.objects.all().iterator():
+        usage = user.files.aggregate(
+            count=models.Count("id"), size=models.Sum("size_bytes")
+        )
+        user.files_count = usage["count"]
+        user.total_size = usage["size"] or 0
+        user.save(update_fields=["files_count", "total_size"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+        ("storage", "0005_storedfile_size_bytes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="files_count",
+            field=models.IntegerField(default=0, verbose_name="Files count"),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="total_size",
+            field=models.BigIntegerField(default=0, verbose_name="Total size"),
+        ),
+        migrations.RunPython(fill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_user_usage_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="quota_files",
+            field=models.IntegerField(
+                blank=True, null=True, verbose_name="Files quota"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="quota_size",
+            field=models.BigIntegerField(
+                blank=True, null=True, verbose_name="Size quota"
+            ),
+        ),
+    ]
@@ -1,10 +1,17 @@
-import os
+import hashlib
 import uuid
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.core.files.storage import default_storage
+from django.utils import timezone
 
-from back.settings import STORAGE_DIR
+from back.settings import STORAGE_QUOTA_FILES, STORAGE_QUOTA_SIZE
+
+# Columns of user's serializer (see User.serialize_row)
+SERIALIZER_COLUMNS = (
+    "username", "email", "first_name", "last_name", "is_superuser", "files_count", "total_size",
+    "quota_files", "quota_size")
 
 
 class User(AbstractUser):
@@ -21,6 +28,10 @@ class User(AbstractUser):
     uuid = models.UUIDField("UUID", default=uuid.uuid4, unique=True, editable=False)
     created_at = models.DateTimeField("Created at", auto_now_add=True, null=True)
     updated_at = models.DateTimeField("Updated at", auto_now=True, null=True)
+    files_count = models.IntegerField("Files count", default=0)
+    total_size = models.BigIntegerField("Total size", default=0)
+    quota_files = models.IntegerField("Files quota", null=True, blank=True)
+    quota_size = models.BigIntegerField("Size quota", null=True, blank=True)
 
     class Meta:
         verbose_name = "User"
@@ -32,28 +43,95 @@ class User(AbstractUser):
 
     @property
     def dir(self):
-        return os.path.join(STORAGE_DIR, str(self.uuid))
+        """ User's dir in storage """
+        return str(self.uuid)
 
     @property
-    def files_count(self):
-        return self.files.all().count()
+    def files_limit(self) -> int:
+        """ Max count of user's files, 0 - unlimited """
+        return self.quota_limit(self.quota_files, STORAGE_QUOTA_FILES)
 
     @property
-    def total_size(self):
-        return sum([f.size for f in self.files.all()])
+    def size_limit(self) -> int:
+        """ Max total size of user's files in bytes, 0 - unlimited """
+        return self.quota_limit(self.quota_size, STORAGE_QUOTA_SIZE)
+
+    @staticmethod
+    def quota_limit(quota, default: int) -> int:
+        """ User's own quota, default one if it isn't set """
+        return default if quota is None else quota
+
+    def quota_error(self, files=0, size=0) -> str:
+        """ Check if adding files/bytes to current usage fits user's quota """
+        if files > 0 and self.files_limit and self.files_count + files > self.files_limit:
+            return f"Files quota exceeded (max {self.files_limit} files)"
+        if size > 0 and self.size_limit and self.total_size + size > self.size_limit:
+            return f"Storage quota exceeded (max {self.size_limit} bytes)"
+        return ""
+
+    def add_usage(self, files=0, size=0):
+        """ Atomically change usage counters (call inside transaction with files changes) """
+        self.updated_at = timezone.now()
+        User.objects.filter(pk=self.pk).update(
+            files_count=models.F("files_count") + files, total_size=models.F("total_size") + size,
+            updated_at=self.updated_at)
+        self.files_count += files
+        self.total_size += size
+
+    def files_validators(self):
+        """
+            Validators of user's files list: set of files and their info is changed
+            returns: (ETag, Last-Modified timestamp)
+        """
+        stats = self.files.aggregate(
+            count=models.Count("id"), updated=models.Max("updated_at"), downloaded=models.Max("downloaded_at"),
+            downloads=models.Sum("downloads"))
+        stamps = [dt.timestamp() for dt in (self.updated_at, stats["updated"], stats["downloaded"]) if dt]
+        tag = hashlib.md5(f"{self.pk}-{stamps}-{stats['count']}-{stats['downloads']}".encode()).hexdigest()
+        return f'"{tag}"', int(max(stamps)) if stamps else None
+
+    def recount_usage(self):
+        """ Rebuild usage counters from user's files """
+        usage = self.files.aggregate(count=models.Count("id"), size=models.Sum("size_bytes"))
+        self.files_count = usage["count"]
+        self.total_size = usage["size"] or 0
+        User.objects.filter(pk=self.pk).update(files_count=self.files_count, total_size=self.total_size)
 
     @property
     def serializer(self):
+        return self.serialize_row(*(getattr(self, column) for column in SERIALIZER_COLUMNS))
+
+    @staticmethod
+    def serialize_rows(users):
+        """ Serialize users (as serializer) straight from DB rows, model instances aren't built """
+        for row in users.values_list(*SERIALIZER_COLUMNS):
+            yield User.serialize_row(*row)
+
+    @staticmethod
+    def serialize_row(username, email, first_name, last_name, is_superuser, files_count, total_size,
+                      quota_files, quota_size) -> dict:
+        """ Serialize user by values of SERIALIZER_COLUMNS """
         return {
-            "username": self.username,
-            "email": self.email,
-            "first_name": self.first_name,
-            "last_name": self.last_name,
-            "is_admin": self.is_superuser,
+            "username": username,
+            "email": email,
+            "first_name": first_name,
+            "last_name": last_name,
+            "is_admin": is_superuser,
+            "files_count": files_count,
+            "total_size": total_size,
+            "files_limit": User.quota_limit(quota_files, STORAGE_QUOTA_FILES),
+            "size_limit": User.quota_limit(quota_size, STORAGE_QUOTA_SIZE),
         }
 
     def delete(self, using=None, keep_parents=False):
-        [f.file.delete() for f in self.files.all()]
-        if os.path.exists(self.dir):
-            os.rmdir(self.dir)
-        return super().delete()
+        [session.abort() for session in self.uploads.all()]
+        files = list(self.files.select_related("blob"))
+        [f.forget_links() for f in files]
+        with transaction.atomic():
+            result = super().delete()
+            [f.release_content() for f in files]
+            transaction.on_commit(self.remove_dir)
+        return result
+
+    def remove_dir(self):
+        default_storage.remove_dir(self.dir)
@@ -1,3 +1,44 @@
+from datetime import datetime, timedelta, timezone
+
 from django.test import TestCase
 
-# Create your tests here.
+from back.settings import STORAGE_QUOTA_FILES, STORAGE_QUOTA_SIZE
+from storage.models import Link
+from users.models import User
+
+
+class SerializerTests(TestCase):
+
+    def test_rows_as_instances(self):
+        User.objects.create_user("alice", "a@example.com", "Passw0rd!")
+        User.objects.create_user("bob", "", "Passw0rd!", quota_files=3, quota_size=0)
+        users = User.objects.order_by("pk")
+        self.assertEqual(list(User.serialize_rows(users)), [user.serializer for user in users])
+
+    def test_quota_fallback(self):
+        alice = User.objects.create_user("alice", "", "Passw0rd!")
+        bob = User.objects.create_user("bob", "", "Passw0rd!", quota_files=3, quota_size=0)
+        self.assertEqual((alice.serializer["files_limit"], alice.serializer["size_limit"]),
+                         (STORAGE_QUOTA_FILES, STORAGE_QUOTA_SIZE))
+        self.assertEqual((bob.serializer["files_limit"], bob.serializer["size_limit"]), (3, 0))
+
+
+class UsersListTests(TestCase):
+
+    def test_admin_list(self):
+        User.objects.create_superuser("admin", "", "Passw0rd!", quota_size=100)
+        self.client.login(username="admin", password="Passw0rd!")
+        users = self.client.get("/user/list/").json()["users"]
+        self.assertEqual(users, [User.objects.get().serializer])
+        self.assertEqual(users[0]["size_limit"], 100)
+
+
+class LoginTests(TestCase):
+
+    def test_expired_links_deleted(self):
+        alice = User.objects.create_user("alice", "", "Passw0rd!")
+        past = datetime.now(timezone.utc) - timedelta(minutes=1)
+        Link.objects.create(owner=alice, archive="zip", expire_at=past)
+        live = Link.objects.create(owner=alice, all_files=True, archive="zip")
+        self.client.post("/user/login/", {"username": "alice", "password": "Passw0rd!"}, content_type="application/json")
+        self.assertEqual(list(Link.objects.all()), [live])
@@ -1,9 +1,11 @@
-from django.http import JsonResponse
 from django.contrib.auth import authenticate, login, logout
+from django.db.models import Q
 
 from back.settings import logger, OK_200, ERROR_SOME, ERROR_BAD_AUTH, ERROR_INVALID_LOGIN, ERROR_INVALID_PSW
 from back.settings import ERROR_NEED_LOGIN, ERROR_EXIST_LOGIN, ERROR_NEED_PSW, ERROR_BAD_PSW
 from back.utils import auth_required, allowed_methods, admin_only, parse_body, valid_username, valid_password
+from back.utils import JsonResponse
+from storage.models import Link, file_columns, serialize_rows
 from users.models import User
 
 
@@ -24,8 +26,8 @@ def user_login(request):
     user = authenticate(request, username=username, password=password)
     if user:
         login(request, user)
-        # Delete expired user's links
-        [[l.delete() for l in f.links.all() if l.expired] for f in user.files.all()]
+        # Delete expired user's links (to files and to archives of files)
+        Link.expired_links().filter(Q(to_file__owner=user) | Q(owner=user)).delete()
         logger.info(f"User: {user} | Action: logged in")
         return JsonResponse({"ok": 200, "user": user.serializer})
 
@@ -155,7 +157,7 @@ def user_create(request):
 @allowed_methods("GET")
 def user_list(request):
     """ Get list of users """
-    return JsonResponse({"ok": 200, "users": [u.seralizer for u in User.objects.all()]})
+    return JsonResponse({"ok": 200, "users": list(User.serialize_rows(User.objects.all()))})
 
 
 @admin_only
@@ -177,7 +179,7 @@ def user_action(request, username: str):
         return JsonResponse({
             "ok": 200,
             "user": user.serializer,
-            "files": [f.serializer for f in user.files.all()],
+            "files": list(serialize_rows(user.files.values_list(*file_columns()))),
         })
 
 #  Change user